@@ -0,0 +1,237 @@
+import os
+import sys
+import csv
+import glob
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Add task1, task2, task3 and task4 directories to the Python path
+for task_dir in ['task1', 'task2', 'task3', 'task4']:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), task_dir)))
+from feature_store import load_features
+
+# The model modules (torch and torchvision for R3D18, pandas for BOF-960, OpenCV for
+# COL-HIST) are imported inside the functions that need them, as in task5.py, so a
+# run only loads what its selected models use.
+
+# Neighbours for many query videos, or a kNN table of the whole corpus, in one run:
+#
+#   python batch_query.py hmdb51_extracted/target_videos/drink 10 --output drink_neighbours.csv
+#   python batch_query.py --all-pairs 10 --exclude-self --output corpus_knn.csv
+
+MODELS = ["R3D18-Layer3-512", "R3D18-Layer4-512", "R3D18-AvgPool-512", "BOF-960", "COL-HIST"]
+
+# Corpus feature file searched by each model (the R3D18 ones are in compare_features.CSV_FILES)
+CORPUS_FILES = {
+    "BOF-960": "./task4/processed_histograms.csv",
+    "COL-HIST": "./task4/histograms.csv",
+}
+
+def corpus_file(model_name):
+    """Corpus feature file of a model."""
+    if model_name.startswith("R3D18"):
+        from compare_features import CSV_FILES
+        return CSV_FILES[model_name]
+    return CORPUS_FILES[model_name]
+
+def get_distance_matrix_function(model_name, col_hist_distance="intersection"):
+    """Return f(queries, corpus_block) -> (queries, corpus_block) distances for a model."""
+    from scipy.spatial.distance import cdist
+
+    if model_name.startswith("R3D18"):
+        return lambda queries, corpus: cdist(queries, corpus, metric='cosine')
+    if model_name == "BOF-960":
+        return lambda queries, corpus: cdist(queries, corpus, metric='euclidean')
+    if model_name == "COL-HIST":
+        from get_closest_neighbours import compute_distances
+        return lambda queries, corpus: compute_distances(queries, corpus, col_hist_distance)
+    raise ValueError(f"Model '{model_name}' is not recognized. Please choose a valid model.")
+
+def blocked_top_k(queries, corpus, distance_function, k, query_block=256, corpus_block=8192):
+    """
+    Yield (first query row, indices, distances) per query block with the k nearest corpus rows.
+
+    Only a (query_block, corpus_block) distance matrix exists at any time; each corpus
+    block is reduced to its top k and merged into the running top k.
+    """
+    k = min(k, corpus.shape[0])
+
+    for query_start in range(0, queries.shape[0], query_block):
+        block_queries = np.asarray(queries[query_start:query_start + query_block], dtype=float)
+        best_distances = np.empty((len(block_queries), 0))
+        best_indices = np.empty((len(block_queries), 0), dtype=int)
+
+        for corpus_start in range(0, corpus.shape[0], corpus_block):
+            block_corpus = np.asarray(corpus[corpus_start:corpus_start + corpus_block], dtype=float)
+            distances = distance_function(block_queries, block_corpus)
+
+            block_k = min(k, distances.shape[1])
+            candidates = np.argpartition(distances, block_k - 1, axis=1)[:, :block_k]
+            best_distances = np.hstack([best_distances, np.take_along_axis(distances, candidates, axis=1)])
+            best_indices = np.hstack([best_indices, candidates + corpus_start])
+
+            if best_distances.shape[1] > k:
+                keep = np.argpartition(best_distances, k - 1, axis=1)[:, :k]
+                best_distances = np.take_along_axis(best_distances, keep, axis=1)
+                best_indices = np.take_along_axis(best_indices, keep, axis=1)
+
+        order = np.argsort(best_distances, axis=1, kind='stable')
+        yield query_start, np.take_along_axis(best_indices, order, axis=1), np.take_along_axis(best_distances, order, axis=1)
+
+def emd_top_k_blocks(queries, corpus, k):
+    """
+    Exact EMD top k in the blocked_top_k format, one query per block: each query goes
+    through col_hist_top_k, which prunes the corpus with the EMD lower bound instead
+    of scoring every row.
+    """
+    from get_closest_neighbours import col_hist_top_k
+
+    for query_start, query in enumerate(queries):
+        indices, distances = col_hist_top_k(np.asarray(query, dtype=float), corpus, "emd", k)
+        yield query_start, indices[None], distances[None]
+
+def find_videos(source):
+    """List query videos from a folder (searched recursively) or a text file with one path per line."""
+    if os.path.isdir(source):
+        videos = glob.glob(os.path.join(source, '**', '*.avi'), recursive=True) + \
+                 glob.glob(os.path.join(source, '**', '*.mp4'), recursive=True)
+        return sorted(videos)
+
+    with open(source, mode='r') as file:
+        return [line.strip() for line in file if line.strip()]
+
+def read_query_stip(video_file):
+    """Read the STIP file that belongs to a query video as a StipData, or return None if it cannot be read."""
+    from get_features import stip_file_path
+    from stip_reader import read_stip_data
+
+    file_path = stip_file_path(video_file + ".txt")
+    try:
+        stip_data = read_stip_data(file_path)
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
+    return stip_data if len(stip_data) > 0 else None
+
+def extract_query_features(video_files, models, batch_size=8, num_workers=None):
+    """
+    Extract the features of every query video for the selected models.
+
+    Returns {model: (video files, (videos, features) matrix)}; videos whose features
+    could not be extracted are left out of that model's matrix.
+    """
+    features = {}
+
+    r3d18_models = [model for model in models if model.startswith("R3D18")]
+    if r3d18_models:
+        import inference_engine
+
+        rows = {model: [] for model in r3d18_models}
+        files = []
+        for _, video_file, layer3, layer4, avgpool in inference_engine.run(video_files, batch_size, num_workers):
+            if layer3 is None:
+                continue
+            files.append(video_file)
+            layer_features = {"R3D18-Layer3-512": layer3, "R3D18-Layer4-512": layer4, "R3D18-AvgPool-512": avgpool}
+            for model in r3d18_models:
+                rows[model].append(layer_features[model])
+        for model in r3d18_models:
+            features[model] = (files, np.array(rows[model]).reshape(len(files), -1))
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        if "BOF-960" in models:
+            from get_features import get_codebook
+
+            codebook = get_codebook()
+            files = []
+            histograms = []
+            for start in range(0, len(video_files), batch_size):
+                batch_files = video_files[start:start + batch_size]
+                stip_arrays = list(executor.map(read_query_stip, batch_files))
+                readable = [(video_file, stip) for video_file, stip in zip(batch_files, stip_arrays) if stip is not None]
+                if readable:
+                    files.extend(video_file for video_file, _ in readable)
+                    histograms.append(codebook.quantize_batch([stip for _, stip in readable]))
+            features["BOF-960"] = (files, np.vstack(histograms) if histograms else np.empty((0, 960)))
+
+        if "COL-HIST" in models:
+            from video_histograms import extract_histograms_from_frames
+            from get_closest_neighbours import R, N_BINS
+
+            histograms = list(executor.map(lambda video_file: extract_histograms_from_frames(video_file, R, N_BINS), video_files))
+            readable = [(video_file, histogram) for video_file, histogram in zip(video_files, histograms)
+                        if histogram is not None and len(histogram) == 3 * R * R * N_BINS]
+            features["COL-HIST"] = ([video_file for video_file, _ in readable],
+                                    np.array([histogram for _, histogram in readable]).reshape(len(readable), -1))
+
+    return features
+
+def write_results(writer, model_name, query_names, corpus_ids, k, top_k_blocks, exclude_self=False):
+    """Write one row per (query, rank) for a model."""
+    for query_start, indices, distances in top_k_blocks:
+        for row, (neighbour_indices, neighbour_distances) in enumerate(zip(indices, distances)):
+            query_row = query_start + row
+            rank = 0
+            for index, distance in zip(neighbour_indices, neighbour_distances):
+                if exclude_self and index == query_row:
+                    continue
+                rank += 1
+                if rank > k:
+                    break
+                writer.writerow([query_names[query_row], model_name, rank, corpus_ids[index], f"{distance:.6f}"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the closest corpus videos for many query videos at once.")
+    parser.add_argument("source", nargs="?", help="Folder of query videos or a text file with one video path per line")
+    parser.add_argument("top_k", type=int)
+    parser.add_argument("--all-pairs", action="store_true", help="Use every corpus video as a query (no extraction)")
+    parser.add_argument("--exclude-self", action="store_true", help="Leave a corpus video out of its own neighbours")
+    parser.add_argument("--models", nargs="+", default=MODELS, choices=MODELS)
+    parser.add_argument("--col-hist-distance", default="intersection", choices=["intersection", "bhattacharyya", "chi_squared", "emd", "emd_sinkhorn"])
+    parser.add_argument("--output", default="batch_results.csv")
+    parser.add_argument("--batch-size", type=int, default=8, help="Videos per extraction batch")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--query-block", type=int, default=256, help="Queries per distance block")
+    parser.add_argument("--corpus-block", type=int, default=8192, help="Corpus rows per distance block")
+    args = parser.parse_args()
+
+    if not args.all_pairs and args.source is None:
+        parser.error("a query folder or file is required unless --all-pairs is given")
+
+    if not args.all_pairs:
+        video_files = find_videos(args.source)
+        print(f"Extracting features for {len(video_files)} query videos")
+        query_features = extract_query_features(video_files, args.models, args.batch_size, args.workers)
+
+    with open(args.output, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['query', 'model', 'rank', 'neighbour', 'distance'])
+
+        for model in args.models:
+            corpus_ids, _, corpus = load_features(corpus_file(model))
+
+            if args.all_pairs:
+                query_names, queries = corpus_ids, corpus
+            else:
+                query_files, queries = query_features[model]
+                query_names = [os.path.basename(video_file) for video_file in query_files]
+
+            if len(query_names) == 0:
+                print(f"No queries for model '{model}'")
+                continue
+
+            # Ask for one more neighbour when a query's own row has to be skipped
+            search_k = args.top_k + 1 if args.exclude_self else args.top_k
+            if model == "COL-HIST" and args.col_hist_distance == "emd":
+                blocks = emd_top_k_blocks(queries, corpus, search_k)
+            else:
+                distance_function = get_distance_matrix_function(model, args.col_hist_distance)
+                blocks = blocked_top_k(queries, corpus, distance_function, search_k, args.query_block, args.corpus_block)
+            write_results(writer, model, query_names, corpus_ids, args.top_k, blocks, args.exclude_self and args.all_pairs)
+            print(f"Wrote top {args.top_k} neighbours of {len(query_names)} queries for model '{model}'")
+
+    print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import multiprocessing
+import numpy as np
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from synthetic import generate_dataset, generate_codebook, generate_corpus_store, generate_stip_array
+from feature_extraction import load_video, extract_feature
+from video_histograms import extract_histograms_from_frames
+from stip_reader import read_stip_file
+from get_features import stip_file_path
+from get_closest_neighbours import compute_distances, load_corpus_sqrt, top_k_indices, R, N_BINS
+from feature_store import load_features
+import compare_features
+from euclidean_neighbours import calculate_distances, get_top_k_neighbors
+
+# Throughput and latency of every pipeline stage on synthetic data:
+#
+#   python benchmarks/run_benchmarks.py --sizes 1000 10000 100000 --output benchmark_results.json
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+COL_HIST_DISTANCES = ["intersection", "bhattacharyya", "chi_squared"]
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is in KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def summarize(latencies):
+    """Calls per second and p50/p99 latency in ms of a list of per-call seconds."""
+    latencies = np.asarray(latencies)
+    return {
+        "calls": len(latencies),
+        "per_sec": len(latencies) / latencies.sum(),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+def time_calls(function, items):
+    """Call function once per item after one warm-up call, returning the latency summary."""
+    function(items[0])
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        function(item)
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+def benchmark_stages(num_videos, stip_points):
+    """Per-video throughput of the extraction stages on synthetic videos and STIP files."""
+    video_files = generate_dataset(DATA_DIR, num_videos, stip_points=stip_points)
+    stip_files = [stip_file_path(video_file + ".txt") for video_file in video_files]
+    codebook = generate_codebook()
+    stip_arrays = [generate_stip_array(stip_points, seed=i).astype(np.float32) for i in range(num_videos)]
+
+    stages = {
+        "load_video": (lambda video_file: load_video(video_file), video_files),
+        "extract_feature": (lambda video_file: extract_feature("R3D18-AvgPool-512", video_file, use_feature_cache=False), video_files),
+        "extract_histograms_from_frames": (lambda video_file: extract_histograms_from_frames(video_file, R, N_BINS, use_feature_cache=False), video_files),
+        "read_stip_file": (read_stip_file, stip_files),
+        "bof_quantize": (codebook.quantize, stip_arrays),
+    }
+
+    results = {}
+    for name, (function, items) in stages.items():
+        results[name] = time_calls(function, items)
+        print(f"  {name}: {results[name]['per_sec']:.2f} videos/sec")
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    return results
+
+def benchmark_search(num_rows, num_queries, k):
+    """Query latency of every neighbour search against synthetic corpora of num_rows rows."""
+    work_dir = os.path.join(DATA_DIR, f"corpus_{num_rows}")
+    os.makedirs(work_dir, exist_ok=True)
+    rng = np.random.default_rng(1)
+
+    r3d18_csv = os.path.join(work_dir, "features_avgpool.csv")
+    bof_csv = os.path.join(work_dir, "processed_histograms.csv")
+    col_hist_csv = os.path.join(work_dir, "histograms.csv")
+    generate_corpus_store(r3d18_csv, num_rows, 512, "dense")
+    generate_corpus_store(bof_csv, num_rows, 960, "counts")
+    generate_corpus_store(col_hist_csv, num_rows, 3 * R * R * N_BINS, "counts")
+
+    r3d18_queries = rng.gamma(1.0, 1.0, (num_queries, 512)).astype(np.float32)
+    bof_queries = rng.poisson(3.0, (num_queries, 960)).astype(float)
+    col_hist_queries = rng.poisson(3.0, (num_queries, 3 * R * R * N_BINS)).astype(float)
+
+    results = {"rows": num_rows}
+
+    start = time.perf_counter()
+    for csv_path in [r3d18_csv, bof_csv, col_hist_csv]:
+        load_features(csv_path)
+    results["load_seconds"] = time.perf_counter() - start
+
+    # The R3D18 search reads its corpus through compare_features.CSV_FILES
+    layer = "R3D18-AvgPool-512"
+    compare_features.CSV_FILES[layer] = r3d18_csv
+    compare_features._indexes.pop(layer, None)
+    index_path = compare_features.ann_index_path(layer)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+    results["R3D18 cosine"] = time_calls(lambda query: compare_features.R3D18(None, layer, k, query), r3d18_queries)
+
+    start = time.perf_counter()
+    compare_features.load_index(layer)
+    results["ann_build_seconds"] = time.perf_counter() - start
+    results["R3D18 ANN"] = time_calls(lambda query: compare_features.R3D18(None, layer, k, query, use_index=True), r3d18_queries)
+
+    results["BOF-960 euclidean"] = time_calls(
+        lambda query: get_top_k_neighbors(calculate_distances(query[:480], query[480:], bof_csv), k), bof_queries)
+
+    _, _, col_hist_corpus = load_features(col_hist_csv)
+    col_hist_sqrt = load_corpus_sqrt(col_hist_csv)
+    for distance_function in COL_HIST_DISTANCES:
+        results[f"COL-HIST {distance_function}"] = time_calls(
+            lambda query: top_k_indices(compute_distances(query, col_hist_corpus, distance_function, col_hist_sqrt)[0], k),
+            col_hist_queries)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def run_in_fresh_process(function, *args):
+    """Run a benchmark in its own process so its peak RSS is not inflated by earlier ones."""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(function, args)
+
+def print_report(stage_results, search_results):
+    if stage_results:
+        table = [[name, f"{r['per_sec']:.2f}", f"{r['p50_ms']:.1f}", f"{r['p99_ms']:.1f}"]
+                 for name, r in stage_results.items() if isinstance(r, dict)]
+        print(f"\nStages (peak RSS {stage_results['peak_rss_mb']:.0f} MB):")
+        print(tabulate(table, headers=["Stage", "Videos/sec", "p50 ms", "p99 ms"], tablefmt="grid"))
+
+    for results in search_results:
+        table = [[name, f"{r['per_sec']:.1f}", f"{r['p50_ms']:.2f}", f"{r['p99_ms']:.2f}"]
+                 for name, r in results.items() if isinstance(r, dict)]
+        print(f"\nNeighbour search over {results['rows']} rows (load {results['load_seconds']:.2f}s, "
+              f"ANN build {results['ann_build_seconds']:.2f}s, peak RSS {results['peak_rss_mb']:.0f} MB):")
+        print(tabulate(table, headers=["Search", "Queries/sec", "p50 ms", "p99 ms"], tablefmt="grid"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extraction and neighbour search on synthetic data.")
+    parser.add_argument("--videos", type=int, default=20, help="Synthetic videos for the stage benchmarks")
+    parser.add_argument("--stip-points", type=int, default=1000, help="Rows per synthetic STIP file")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Corpus rows for the search benchmarks")
+    parser.add_argument("--queries", type=int, default=50, help="Queries per search benchmark")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    stage_results = None
+    if not args.skip_stages:
+        print(f"Benchmarking stages on {args.videos} synthetic videos")
+        stage_results = run_in_fresh_process(benchmark_stages, args.videos, args.stip_points)
+
+    search_results = []
+    for num_rows in args.sizes:
+        print(f"Benchmarking neighbour search over {num_rows} rows")
+        search_results.append(run_in_fresh_process(benchmark_search, num_rows, args.queries, args.k))
+
+    print_report(stage_results, search_results)
+
+    if args.output:
+        with open(args.output, mode="w") as file:
+            json.dump({"stages": stage_results, "search": search_results, "time": time.time()}, file, indent=2)
+        print(f"Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
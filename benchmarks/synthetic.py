@@ -0,0 +1,108 @@
+import os
+import sys
+import cv2
+import numpy as np
+
+for task_dir in ['task1', 'task2', 'task3', 'task4']:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', task_dir)))
+from codebook import Codebook, PAIRS, N_CLUSTERS
+from feature_store import save_store
+
+# Synthetic stand-ins for the HMDB51 videos, their STIP files and the corpus feature
+# files, so throughput can be measured without the real dataset.
+
+STIP_HEADER = "# point-type x y t sigma2 tau2 detector-confidence dscr-hog(72) dscr-hof(90)\n"
+HOG_SIZE = 72
+HOF_SIZE = 90
+
+def generate_video(video_path, num_frames=64, width=320, height=240, fps=25, seed=0):
+    """Write an MJPG AVI of moving coloured blocks over noise, similar in size to an HMDB51 clip."""
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a video writer for {video_path}")
+
+    background = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    colours = rng.integers(0, 256, (4, 3))
+    velocities = rng.integers(-6, 7, (4, 2))
+    positions = rng.integers(0, min(width, height) // 2, (4, 2))
+
+    for i in range(num_frames):
+        frame = background.copy()
+        for colour, position, velocity in zip(colours, positions, velocities):
+            x, y = (position + velocity * i) % (width - 40, height - 40)
+            frame[y:y + 40, x:x + 40] = colour
+        writer.write(frame)
+
+    writer.release()
+
+def generate_stip_array(num_points=1000, seed=0):
+    """Random STIP rows in the 169-column layout: point-type x y t sigma2 tau2 confidence, HoG(72), HoF(90)."""
+    rng = np.random.default_rng(seed)
+    pairs = np.array(PAIRS)[rng.integers(0, len(PAIRS), num_points)]
+
+    header = np.column_stack([
+        np.ones(num_points),
+        rng.integers(0, 320, num_points),
+        rng.integers(0, 240, num_points),
+        rng.integers(0, 100, num_points),
+        pairs,
+        rng.random(num_points),
+    ])
+    descriptors = rng.random((num_points, HOG_SIZE + HOF_SIZE)).round(3)
+
+    return np.hstack([header, descriptors])
+
+def generate_stip_file(file_path, num_points=1000, seed=0):
+    """Write a STIP text file with the header comment and column layout of the HMDB51 STIP files."""
+    with open(file_path, mode="w") as file:
+        file.write(STIP_HEADER)
+        np.savetxt(file, generate_stip_array(num_points, seed), fmt="%g")
+
+def generate_dataset(root, num_videos=20, num_classes=2, num_frames=64, stip_points=1000):
+    """
+    Create root/hmdb51_extracted/target_videos/<class>/*.avi and the matching
+    root/hmdb51_org_stips/target_videos/<class>/*.avi.txt files; returns the video paths.
+    """
+    video_files = []
+    for i in range(num_videos):
+        class_name = f"class_{i % num_classes}"
+        video_dir = os.path.join(root, "hmdb51_extracted", "target_videos", class_name)
+        stip_dir = os.path.join(root, "hmdb51_org_stips", "target_videos", class_name)
+        os.makedirs(video_dir, exist_ok=True)
+        os.makedirs(stip_dir, exist_ok=True)
+
+        video_path = os.path.join(video_dir, f"video_{i:05d}.avi")
+        if not os.path.exists(video_path):
+            generate_video(video_path, num_frames, seed=i)
+        stip_path = os.path.join(stip_dir, f"video_{i:05d}.avi.txt")
+        if not os.path.exists(stip_path):
+            generate_stip_file(stip_path, stip_points, seed=i)
+        video_files.append(video_path)
+
+    return video_files
+
+def generate_codebook(seed=0):
+    """A codebook of random HoG and HoF centers for every (sigma, tau) pair."""
+    rng = np.random.default_rng(seed)
+    hog_centers = {pair: rng.random((N_CLUSTERS, HOG_SIZE), dtype=np.float32) for pair in PAIRS}
+    hof_centers = {pair: rng.random((N_CLUSTERS, HOF_SIZE), dtype=np.float32) for pair in PAIRS}
+    return Codebook(hog_centers, hof_centers)
+
+def generate_corpus_store(csv_path, num_rows, num_features, kind="dense", seed=0):
+    """
+    Write a binary feature store (no CSV) of num_rows synthetic rows for csv_path.
+
+    kind="dense" gives non-negative float features like the R3D18 layers;
+    kind="counts" gives integer histogram counts like BOF-960 and COL-HIST.
+    """
+    rng = np.random.default_rng(seed)
+    if kind == "counts":
+        matrix = rng.poisson(3.0, (num_rows, num_features)).astype(np.float32)
+    else:
+        matrix = rng.gamma(1.0, 1.0, (num_rows, num_features)).astype(np.float32)
+
+    ids = [f"video_{i:06d}.avi" for i in range(num_rows)]
+    paths = [f"synthetic/{video_id}" for video_id in ids]
+    save_store(csv_path, "video_name", "video_path", ids, paths, matrix)
+    return matrix
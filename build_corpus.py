@@ -0,0 +1,235 @@
+import os
+import sys
+import csv
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Add task1, task2, task3 and task4 directories to the Python path
+for task_dir in ['task1', 'task2', 'task3', 'task4']:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), task_dir)))
+from feature_extraction import NUM_FRAMES, FRAME_SIZE, clip_to_tensor, extract_features_batch
+from inference_engine import init_worker, split_into_batches
+from get_features import get_codebook, stip_file_path
+from codebook import HISTOGRAM_SIZE
+from stip_reader import read_stip_data
+from video_histograms import decode_video, histograms_from_key_frames
+from get_closest_neighbours import R, N_BINS
+from feature_store import convert_csv
+from manifest import Manifest, committed_paths, csv_row_path, read_csv_paths, reconcile_csv
+from profiling import profiler, call_profiled
+
+# Builds all five corpus outputs in one walk over the videos: every video is decoded
+# once, and the same work unit computes its R3D18 features, its COL-HIST histogram
+# and the BOF histogram of its STIP file.
+#
+#   python build_corpus.py hmdb51_extracted/target_videos
+
+OUTPUT_FILES = {
+    "R3D18-Layer3-512": "features_layer3.csv",
+    "R3D18-Layer4-512": "features_layer4.csv",
+    "R3D18-AvgPool-512": "features_avgpool.csv",
+    "BOF-960": "processed_histograms.csv",
+    "COL-HIST": "histograms.csv",
+}
+MODELS = list(OUTPUT_FILES)
+MANIFEST_FILE = "corpus.manifest.json"
+
+def read_video_stip(video_file):
+    """Read the STIP file that belongs to a video as a StipData, or return None if it is missing or empty."""
+    file_path = stip_file_path(video_file + ".txt")
+    try:
+        stip_data = read_stip_data(file_path)
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
+    return stip_data if len(stip_data) > 0 else None
+
+def process_batch(video_files):
+    """
+    Compute the features of every model for a batch of videos.
+
+    Returns (video_file, {model: features}) pairs; the dict is None when any model
+    failed, so a video is either in all five outputs or in none.
+    """
+    results = []
+    clips = []
+    complete = []
+    histograms = []
+    stip_arrays = []
+
+    for video_file in video_files:
+        try:
+            clip, key_frames = decode_video(video_file, NUM_FRAMES, FRAME_SIZE)
+        except Exception as e:
+            print(f"Error processing {video_file}: {e}")
+            results.append((video_file, None))
+            continue
+
+        histogram = histograms_from_key_frames(key_frames, R, N_BINS)
+        stip_data = read_video_stip(video_file)
+        if histogram is None or stip_data is None:
+            results.append((video_file, None))
+            continue
+
+        clips.append(clip_to_tensor(clip))
+        complete.append(video_file)
+        histograms.append(histogram)
+        stip_arrays.append(stip_data)
+
+    if complete:
+        try:
+            layer_features = extract_features_batch(clips)
+            bof_vectors = get_codebook().quantize_batch(stip_arrays)
+        except Exception as e:
+            # A failed forward pass fails only this batch's videos, not the whole build
+            print(f"Error extracting features for {len(complete)} videos: {e}")
+            return results + [(video_file, None) for video_file in complete]
+
+        for video_file, layers, bof_vector, histogram in zip(complete, layer_features, bof_vectors, histograms):
+            results.append((video_file, {**layers, "BOF-960": bof_vector, "COL-HIST": histogram}))
+
+    return results
+
+def output_row(model, video_file, features, csv_path):
+    """
+    Format one output row in the layout of that model's corpus CSV. Paths are stored
+    relative to the CSV's directory, like the committed ../hmdb51_extracted/... rows.
+    """
+    if model == "BOF-960":
+        stip_path = stip_file_path(video_file + ".txt")
+        return [os.path.basename(stip_path).split('.')[0], csv_row_path(stip_path, csv_path)] + list(features)
+    if model == "COL-HIST":
+        return [os.path.basename(video_file), csv_row_path(video_file, csv_path)] + list(features)
+    return [os.path.basename(video_file), csv_row_path(video_file, csv_path)] + list(features.flatten())
+
+def output_header(model, num_features):
+    """Return the header of a model's corpus CSV."""
+    if model == "BOF-960":
+        return (['video_name', 'video_path'] + [f'hog_histogram_bin_{i}' for i in range(HISTOGRAM_SIZE)] +
+                [f'hof_histogram_bin_{i}' for i in range(HISTOGRAM_SIZE)])
+    if model == "COL-HIST":
+        return ['file_name', 'file_path'] + [f'hist_bin_{i}' for i in range(num_features)]
+    return ['filename', 'filepath'] + [f"feature_{i}" for i in range(num_features)]
+
+def append_rows(csv_path, model, rows):
+    """Append rows to a corpus CSV, writing its header first if the file is new."""
+    file_exists = os.path.isfile(csv_path)
+    with open(csv_path, mode='a', newline='') as file:
+        writer = csv.writer(file)
+        if not file_exists:
+            writer.writerow(output_header(model, len(rows[0]) - 2))
+        writer.writerows(rows)
+
+def existing_videos(output_paths):
+    """Absolute paths of the videos that have a row in every existing output, e.g. of a corpus built before manifests were kept."""
+    videos = committed_paths([csv_path for model, csv_path in output_paths.items() if model != "BOF-960"])
+    if os.path.exists(output_paths["BOF-960"]):
+        stip_paths = read_csv_paths(output_paths["BOF-960"])
+        videos = {video for video in videos if stip_file_path(video + ".txt") in stip_paths}
+    return videos
+
+def build_corpus(video_files, output_dir, batch_size=8, num_workers=None, chunk_size=64):
+    """
+    Build or update the five corpus outputs for video_files.
+
+    Only new or changed videos are processed. Rows are committed every chunk_size
+    videos to all five CSVs at once, followed by the manifest, and the binary
+    stores are rebuilt at the end. On the first run the videos already in every
+    output are adopted into the new manifest rather than pruned.
+    """
+    output_paths = {model: os.path.join(output_dir, file_name) for model, file_name in OUTPUT_FILES.items()}
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_FILE))
+    if not manifest.exists:
+        manifest.adopt(existing_videos(output_paths), video_files)
+        if manifest.entries:
+            print(f"Adopted {len(manifest.entries)} videos already in {output_dir} into {manifest.manifest_path}")
+
+    pending, removed = manifest.plan(video_files)
+    manifest.forget(pending + removed)
+    manifest.save()
+
+    # BOF rows are keyed by their STIP path, every other output by the video path
+    keep_paths = set(manifest.entries)
+    dropped = 0
+    for model, csv_path in output_paths.items():
+        keep = {stip_file_path(path + ".txt") for path in keep_paths} if model == "BOF-960" else keep_paths
+        dropped_rows = reconcile_csv(csv_path, keep)
+        if dropped_rows:
+            print(f"Removed {dropped_rows} stale rows from {csv_path}")
+        dropped += dropped_rows
+
+    print(f"{len(video_files) - len(pending)} videos up to date, {len(pending)} to process, {len(removed)} removed, "
+          f"{dropped} stale rows dropped")
+
+    rows = {model: [] for model in MODELS}
+    done = []
+
+    def commit():
+        if done:
+            for model in MODELS:
+                append_rows(output_paths[model], model, rows[model])
+                rows[model].clear()
+        manifest.record(done)
+        manifest.save()
+        done.clear()
+
+    num_workers = num_workers or os.cpu_count()
+    num_threads = max(1, os.cpu_count() // num_workers)
+    start = time.perf_counter()
+    processed = 0
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=init_worker, initargs=(num_threads,)) as executor:
+        futures = [executor.submit(call_profiled, process_batch, batch) for batch in split_into_batches(pending, batch_size)]
+
+        for future in as_completed(futures):
+            results, snapshot = future.result()
+            profiler.merge(snapshot)
+            for video_file, features in results:
+                processed += 1
+                # Failed videos stay out of the manifest and are retried on the next run
+                if features is None:
+                    continue
+
+                for model in MODELS:
+                    rows[model].append(output_row(model, video_file, features[model], output_paths[model]))
+                done.append(video_file)
+
+                if len(done) >= chunk_size:
+                    commit()
+
+            elapsed = time.perf_counter() - start
+            print(f"{processed}/{len(pending)} videos, {processed / elapsed:.2f} videos/sec")
+
+    commit()
+
+    # Rebuilt even when nothing was processed, so the stores always match the reconciled CSVs
+    for csv_path in output_paths.values():
+        if os.path.exists(csv_path):
+            convert_csv(csv_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the R3D18, BOF and COL-HIST corpus files in one pass over the videos.")
+    parser.add_argument("base_dir", nargs="?", default="hmdb51_extracted/target_videos")
+    parser.add_argument("--output-dir", default="task4")
+    parser.add_argument("--batch-size", type=int, default=8, help="Videos per work unit and forward pass")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Videos per committed chunk")
+    parser.add_argument("--profile", nargs="?", const="build_profile.json", help="Write a JSON timing breakdown of the build")
+    args = parser.parse_args()
+
+    video_files = sorted(glob.glob(os.path.join(args.base_dir, '*', '*.avi')) +
+                         glob.glob(os.path.join(args.base_dir, '*', '*.mp4')))
+
+    print(f"Found {len(video_files)} videos in {args.base_dir}")
+    start = time.perf_counter()
+    build_corpus(video_files, args.output_dir, args.batch_size, args.workers, args.chunk_size)
+
+    if args.profile:
+        profiler.write_json(args.profile, build="corpus", videos=len(video_files), wall_seconds=time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
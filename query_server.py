@@ -0,0 +1,130 @@
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Long-running query service for task5: the R3D18 model, the BOF cluster centers and
+# the corpus matrices are loaded once at startup and reused by every request.
+#
+#   python query_server.py --port 8765
+#   python task5.py <video_path> <top_k> --server http://127.0.0.1:8765
+#
+# Run it from the repository root, like task5.py.
+
+def send_query(server_url, video_path, models, top_k):
+    """Send a query to a running server and return {model: [(file name, distance), ...]}."""
+    payload = json.dumps({"video_path": video_path, "models": list(models), "k": top_k}).encode()
+    request = urllib.request.Request(server_url.rstrip("/") + "/query", data=payload,
+                                     headers={"Content-Type": "application/json"})
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            body = json.load(response)
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(f"Query failed ({e.code}): {json.load(e).get('error')}") from None
+
+    return {model: [tuple(result) for result in results] for model, results in body["results"].items()}
+
+def warm_up(task5):
+    """Load the model, the cluster centers and every corpus matrix before serving."""
+    from feature_extraction import prepare_model
+    from compare_features import load_features_from_csv
+    from get_features import get_codebook
+    from feature_store import load_features
+
+    prepare_model()
+
+    for layer in ["R3D18-Layer3-512", "R3D18-Layer4-512", "R3D18-AvgPool-512"]:
+        load_features_from_csv(layer)
+    load_features("./task4/processed_histograms.csv")
+    load_features("./task4/histograms.csv")
+
+    try:
+        get_codebook()
+    except FileNotFoundError as e:
+        print(f"BOF-960 cluster centers not preloaded: {e}")
+
+class QueryHandler(BaseHTTPRequestHandler):
+    task5 = None
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok", "models": self.task5.MODELS})
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/query":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            video_path = request["video_path"]
+            if "model" in request:
+                models = [request["model"]]
+            else:
+                models = request.get("models") or self.task5.MODELS
+            top_k = int(request.get("k", 10))
+
+            for model in models:
+                if model not in self.task5.MODELS:
+                    raise ValueError(f"Model '{model}' is not recognized.")
+            if not os.path.exists(video_path):
+                raise ValueError(f"Video file '{video_path}' does not exist.")
+        except (KeyError, ValueError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        try:
+            start = time.perf_counter()
+            results = {
+                model: [(file_name, float(distance)) for file_name, distance in closest_videos]
+                for model, closest_videos in self.task5.process_video_models(video_path, models, top_k)
+            }
+            elapsed = time.perf_counter() - start
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+
+        self.send_json(200, {"video_path": video_path, "k": top_k, "results": results, "elapsed": elapsed})
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve task5 neighbour queries over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import task5
+
+    start = time.perf_counter()
+    warm_up(task5)
+    print(f"Loaded model and corpus in {time.perf_counter() - start:.1f}s")
+
+    QueryHandler.task5 = task5
+    server = ThreadingHTTPServer((args.host, args.port), QueryHandler)
+    print(f"Serving queries on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
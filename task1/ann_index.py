@@ -0,0 +1,159 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+# Approximate cosine search over the 512-d R3D18 features with an inverted-file (IVF)
+# index: vectors are L2-normalised and bucketed by their nearest k-means centroid, and a
+# query only scans the vectors in its nprobe closest buckets.
+
+DEFAULT_NPROBE = 8
+
+def normalize(vectors):
+    """L2-normalise rows so a dot product is the cosine similarity."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def train_centroids(vectors, nlist, n_iter=10, seed=0):
+    """Spherical k-means: nlist unit centroids that partition the (normalised) vectors."""
+    rng = np.random.default_rng(seed)
+    vectors = normalize(vectors)
+    nlist = min(nlist, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=nlist)
+
+        # Re-seed empty lists with random vectors
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+        centroids = normalize(sums)
+
+    return centroids
+
+class IVFIndex:
+    """Inverted-file index for approximate cosine nearest neighbours, with incremental inserts."""
+
+    def __init__(self, centroids):
+        self.centroids = normalize(centroids)
+        self.vectors = np.empty((0, self.centroids.shape[1]), dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int64)
+        self.ids = []
+        self.lists = [[] for _ in range(len(self.centroids))]  # Row numbers per centroid
+        self.size = 0
+
+    @classmethod
+    def build(cls, ids, vectors, nlist=None, n_iter=10, seed=0):
+        """Train centroids on the vectors (nlist defaults to about sqrt(n)) and add them all."""
+        nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+        index = cls(train_centroids(vectors, nlist, n_iter, seed))
+        index.add(ids, vectors)
+        return index
+
+    def add(self, ids, vectors):
+        """Insert vectors under the given ids; the centroids are not retrained."""
+        vectors = normalize(vectors)
+        assignments = np.argmax(vectors @ self.centroids.T, axis=1)
+
+        # Grow the storage geometrically so repeated inserts stay cheap
+        needed = self.size + len(vectors)
+        if needed > len(self.vectors):
+            capacity = max(needed, 2 * len(self.vectors))
+            grown = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.vectors[:self.size]
+            self.vectors = grown
+            grown_assignments = np.empty(capacity, dtype=np.int64)
+            grown_assignments[:self.size] = self.assignments[:self.size]
+            self.assignments = grown_assignments
+
+        self.vectors[self.size:needed] = vectors
+        self.assignments[self.size:needed] = assignments
+        for row, centroid in enumerate(assignments, start=self.size):
+            self.lists[centroid].append(row)
+
+        self.ids.extend(ids)
+        self.size = needed
+
+    def holds_prefix_of(self, ids, vectors):
+        """Check that the index holds exactly the first rows of (ids, vectors), e.g. a store that has only grown since."""
+        if self.size > len(ids) or self.ids != list(ids[:self.size]):
+            return False
+        return np.allclose(self.vectors[:self.size], normalize(vectors[:self.size]), atol=1e-5)
+
+    def search(self, query, k, nprobe=DEFAULT_NPROBE):
+        """Approximate top k: returns [(id, cosine distance)] scanning the nprobe closest lists."""
+        query = normalize(query)[0]
+        nprobe = min(nprobe, len(self.centroids))
+        probed = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+        candidates = np.concatenate([np.asarray(self.lists[c], dtype=np.int64) for c in probed])
+        return self._rank(query, candidates, k)
+
+    def search_exact(self, query, k):
+        """Exact top k over every stored vector, for checking recall."""
+        query = normalize(query)[0]
+        return self._rank(query, np.arange(self.size), k)
+
+    def _rank(self, query, candidates, k):
+        if len(candidates) == 0:
+            return []
+
+        distances = 1.0 - self.vectors[candidates] @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind='stable')]
+
+        return [(self.ids[candidates[i]], float(distances[i])) for i in top]
+
+    def save(self, path):
+        """Write the index to a .npz file."""
+        np.savez(path, centroids=self.centroids, vectors=self.vectors[:self.size],
+                 assignments=self.assignments[:self.size], ids=np.array(self.ids, dtype=str))
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()."""
+        data = np.load(path)
+        index = cls(data['centroids'])
+        index.vectors = data['vectors']
+        index.assignments = data['assignments']
+        index.ids = data['ids'].tolist()
+        index.size = len(index.ids)
+        for row, centroid in enumerate(index.assignments):
+            index.lists[centroid].append(row)
+        return index
+
+def recall_at_k(index, queries, k, nprobe=DEFAULT_NPROBE):
+    """Mean fraction of the exact top k ids that the approximate search also returns."""
+    hits = 0
+    for query in queries:
+        exact = {video_id for video_id, _ in index.search_exact(query, k)}
+        approximate = {video_id for video_id, _ in index.search(query, k, nprobe)}
+        hits += len(exact & approximate)
+    return hits / (len(queries) * k)
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from compare_features import load_index, load_features_from_csv
+
+    parser = argparse.ArgumentParser(description="Build the R3D18 ANN indexes and check recall@k against exact search.")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, DEFAULT_NPROBE, 16])
+    parser.add_argument("--queries", type=int, default=200, help="Corpus rows used as queries")
+    args = parser.parse_args()
+
+    for layer in ["R3D18-Layer3-512", "R3D18-Layer4-512", "R3D18-AvgPool-512"]:
+        index = load_index(layer)
+        _, _, features = load_features_from_csv(layer)
+        queries = features[np.random.default_rng(0).choice(len(features), min(args.queries, len(features)), replace=False)]
+
+        print(f"{layer}: {index.size} vectors in {len(index.centroids)} lists")
+        for nprobe in args.nprobe:
+            print(f"  nprobe={nprobe}: recall@{args.k} = {recall_at_k(index, queries, args.k, nprobe):.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,60 +1,104 @@
-import pandas as pd
+import os
+import sys
+import threading
 import numpy as np
 from scipy.spatial.distance import cdist
 from feature_extraction import extract_feature  # Importing the function from feature_extraction.py
+from ann_index import IVFIndex, DEFAULT_NPROBE
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from feature_store import load_features, store_version
+from profiling import profiler
+
+CSV_FILES = {
+    'R3D18-Layer3-512': './task4/features_layer3.csv',
+    'R3D18-Layer4-512': './task4/features_layer4.csv',
+    'R3D18-AvgPool-512': './task4/features_avgpool.csv'
+}
 
 def load_features_from_csv(layer):
-    """Load features from predefined CSV files into a DataFrame based on the layer."""
-    csv_files = {
-        'R3D18-Layer3-512': './task4/features_layer3.csv',
-        'R3D18-Layer4-512': './task4/features_layer4.csv',
-        'R3D18-AvgPool-512': './task4/features_avgpool.csv'
-    }
-    
-    if layer not in csv_files:
+    """Load (filenames, filepaths, feature matrix) for a layer from the task4 feature store."""
+    if layer not in CSV_FILES:
         raise ValueError(f"Layer {layer} is not supported or file path is not available.")
     
-    file_path = csv_files[layer]
-    features_df = pd.read_csv(file_path)
+    file_path = CSV_FILES[layer]
     
-    return features_df
+    return load_features(file_path)
+
+# Opened ANN indexes, one per layer: {layer: (version, index)}
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def ann_index_path(layer):
+    """Path of the saved ANN index of a layer."""
+    return os.path.splitext(CSV_FILES[layer])[0] + ".ivf.npz"
+
+def _index_version(layer):
+    index_path = ann_index_path(layer)
+    return store_version(CSV_FILES[layer]) + (os.path.getmtime(index_path) if os.path.exists(index_path) else None,)
+
+def load_index(layer):
+    """
+    Load the ANN index of a layer, kept in sync with the feature store.
+
+    The opened index is reused until the store or the saved index changes, so a
+    long-running process picks up rebuilds. Rows appended to the store since the
+    index was saved are added to it; any other change rebuilds it.
+    """
+    with _indexes_lock:
+        if layer in _indexes and _indexes[layer][0] == _index_version(layer):
+            return _indexes[layer][1]
+
+        index_path = ann_index_path(layer)
+        filenames, _, all_features = load_features_from_csv(layer)
 
-def R3D18(video_path, layer, k):
-    """Process video features and find k closest neighbors using cosine distance."""
+        # A fresh object, so searches running on the previous index are not disturbed
+        index = IVFIndex.load(index_path) if os.path.exists(index_path) else None
+        if index is None or not index.holds_prefix_of(filenames, all_features):
+            print(f"Building ANN index for {layer}")
+            index = IVFIndex.build(filenames, all_features)
+            index.save(index_path)
+        elif index.size < len(filenames):
+            print(f"Adding {len(filenames) - index.size} rows to the ANN index for {layer}")
+            index.add(filenames[index.size:], all_features[index.size:])
+            index.save(index_path)
+
+        _indexes[layer] = (_index_version(layer), index)
+        return index
+
+def R3D18(video_path, layer, k, video_features=None, use_index=False, nprobe=DEFAULT_NPROBE):
+    """Process video features and find k closest neighbors using cosine distance.
+
+    video_features can be passed in (e.g. from extract_features) to skip extraction.
+    use_index=True searches the approximate ANN index instead of every row; nprobe
+    trades speed for recall.
+    """
     
     # Extract features from the video
-    video_features = extract_feature(layer, video_path)
-    
-    # Load features from CSV files
-    all_features_df = load_features_from_csv(layer)
-    
-    # Extract histograms from DataFrame
-    all_histograms = []
-    for _, row in all_features_df.iterrows():
-        # Assuming features are in columns starting from index 2 and contain 512 values
-        histogram = row[2:].values.astype(float)  # Convert to float
-        all_histograms.append(histogram)
+    if video_features is None:
+        video_features = extract_feature(layer, video_path)
+
+    if use_index:
+        index = load_index(layer)
+        with profiler.timer("ann_search"):
+            return index.search(video_features, k, nprobe)
     
-    all_histograms = np.array(all_histograms)
+    # Load features from the feature store
+    filenames, _, all_features = load_features_from_csv(layer)
     
     # Extract the video histogram
     video_histogram = video_features.reshape(1, -1).astype(float)  # Reshape and convert to float
 
     # Compute distances using cosine distance
-    distances = cdist(all_histograms, video_histogram, metric='cosine')
-    
-    # Find k closest neighbors
-    closest_indices = np.argsort(distances[:, 0])[:k]
-    
-    # Prepare the results
-    closest_neighbors = all_features_df.iloc[closest_indices].copy()
-    closest_neighbors['distance'] = distances[closest_indices, 0]
+    with profiler.timer("distance"):
+        distances = cdist(all_features, video_histogram, metric='cosine')
+        profiler.count("rows_scored", len(all_features))
     
-    # Select only the 'filename' (or 'video_name') and 'distance' columns
-    results_df = closest_neighbors[['filename', 'distance']]
+        # Find k closest neighbors
+        closest_indices = np.argsort(distances[:, 0])[:k]
     
-    # Convert DataFrame to list of dictionaries
-    results_tuples = list(results_df.itertuples(index=False, name=None))
+    # Pair the filenames with their distances
+    results_tuples = [(filenames[i], distances[i, 0]) for i in closest_indices]
     
     return results_tuples
 
@@ -1,14 +1,39 @@
+import os
+import sys
+import threading
 import torch
 import cv2
 import numpy as np
-from torchvision.models.video import r3d_18
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from profiling import profiler
+from feature_cache import feature_cache, content_hash
+
+# Optional R3D18 state dict saved with torch.save, e.g. pretrained weights; it is
+# read memory-mapped. Set in the environment so build worker processes see it too.
+WEIGHTS_ENV = "R3D18_WEIGHTS"
+
+# Optional inference mode from task1/inference_modes.py (e.g. "bf16"), eager fp32 by default
+INFERENCE_MODE_ENV = "R3D18_INFERENCE_MODE"
 
 # Global variables to store hook outputs
 layer3_output = None
 layer4_output = None
 avgpool_output = None
 
-model = r3d_18()
+# Built on first use by get_model, so importing this module does not construct the network
+model = None
+device_in_use = None
+
+# The hooks write to module globals, so forward passes must not overlap between threads
+inference_lock = threading.Lock()
+model_lock = threading.Lock()
+
+# FeatureExtractor of the selected inference mode, built on first use; a failure to
+# build it is kept too, so later batches raise it again instead of rebuilding
+extractor = None
+extractor_error = None
+extractor_lock = threading.Lock()
 
 def hook_fn(module, input, output):
     global layer3_output, layer4_output, avgpool_output
@@ -20,78 +45,218 @@ def hook_fn(module, input, output):
         avgpool_output = output
     return output
 
-def load_video(video_path):
+NUM_FRAMES = 32  # Frames per clip fed to the model
+FRAME_SIZE = 112  # Model input height and width
+
+@profiler.timed("decode_clip")
+def decode_clip(video_path, num_frames=NUM_FRAMES, sampling="head"):
+    """
+    Decode num_frames RGB frames into a preallocated (num_frames, 112, 112, 3) uint8 buffer.
+
+    sampling="head" keeps the first num_frames frames and stops decoding there.
+    sampling="uniform" spreads num_frames evenly across the video; frames that are
+    not kept are only grab()-ed, never retrieved. Short videos are padded with their
+    last frame.
+    """
     cap = cv2.VideoCapture(video_path)
 
     assert cap.isOpened(), f"Failed to open video file {video_path}"
 
-    frames = []
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if sampling == "uniform" and total_frames >= num_frames:
+        wanted = np.linspace(0, total_frames - 1, num_frames).round().astype(int)
+    elif sampling in ("head", "uniform"):
+        wanted = np.arange(num_frames)
+    else:
+        raise ValueError(f"Sampling '{sampling}' is not supported.")
+
+    clip = np.empty((num_frames, FRAME_SIZE, FRAME_SIZE, 3), dtype=np.uint8)
+    count = 0
+    index = 0
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
+    while count < num_frames:
+        if not cap.grab():
             break
 
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        frame = cv2.resize(frame, (112, 112))  # Resize to match model input size
-        frames.append(frame)
-    
+        if index == wanted[count]:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+
+            frame = cv2.resize(frame, (FRAME_SIZE, FRAME_SIZE))  # Resize to match model input size
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=clip[count])
+            count += 1
+
+        index += 1
+
     cap.release()
+    profiler.count("frames_decoded", index)
+    profiler.count("bytes_read", os.path.getsize(video_path))
+
+    assert count > 0, f"No frames decoded from video file {video_path}"
 
-    num_frames = 32  # Adjust this as needed
-    if len(frames) < num_frames:
-        frames.extend([frames[-1]] * (num_frames - len(frames)))
+    if count < num_frames:
+        clip[count:] = clip[count - 1]
 
-    frames = frames[:32]
+    return clip
 
-    video_tensor = torch.tensor(np.array(frames)).float() / 255.0  # Normalize pixel values
+def clip_to_tensor(clip):
+    """Turn a decoded (D, H, W, C) uint8 clip into a normalised (1, C, D, H, W) float tensor."""
+    video_tensor = torch.from_numpy(clip)  # Shares memory with the decode buffer
     video_tensor = video_tensor.permute(3, 0, 1, 2).unsqueeze(0)  # Convert to (N, C, D, H, W)
+    video_tensor = video_tensor.float() / 255.0  # Normalize pixel values
     
     return video_tensor
 
-def extract_feature(layer, video_path):
-    # Load and prepare the model
-    device = torch.device('cuda' if torch.cuda.is_available() else 
-                           'mps' if torch.backends.mps.is_available() else 
-                           'cpu')
-    
-    model.to(device)
-    model.eval()
+def load_video(video_path, num_frames=NUM_FRAMES, sampling="head"):
+    return clip_to_tensor(decode_clip(video_path, num_frames, sampling))
+
+LAYERS = ["R3D18-Layer3-512", "R3D18-Layer4-512", "R3D18-AvgPool-512"]
+
+def reduce_layer_output(layer, output):
+    """Reduce a hooked layer output of shape (N, ...) to (N, 512) features."""
+    batch_size = output.shape[0]
+    match (layer):
+        case "R3D18-Layer3-512":
+            tensor_reshaped = output.view(batch_size, 256, 2, 4, 14, 14)  # Shape: [N, 256, 2, 4, 14, 14]
+            tensor_avg_blocks = tensor_reshaped.mean(dim=[3,4,5])  # Shape: [N, 256, 2]
+            return tensor_avg_blocks.view(batch_size, -1)
+
+        case "R3D18-Layer4-512":
+            return output.mean(dim=[2,3,4])
+
+        case "R3D18-AvgPool-512":
+            return output.view(batch_size, -1)
 
-    # Register hooks
-    hook1 = model.layer3.register_forward_hook(hook_fn)
-    hook2 = model.layer4.register_forward_hook(hook_fn)
-    hook3 = model.avgpool.register_forward_hook(hook_fn)
+        case _:
+            raise ValueError(f"Layer {layer} is not supported.")
 
-    video_tensor = load_video(video_path)
-    video_tensor = video_tensor.to(device)
+def get_device():
+    """Pick the best available torch device."""
+    return torch.device('cuda' if torch.cuda.is_available() else 
+                        'mps' if torch.backends.mps.is_available() else 
+                        'cpu')
+
+def weights_path():
+    """Path of the R3D18 weights file named by R3D18_WEIGHTS, or None for the default initialisation."""
+    return os.environ.get(WEIGHTS_ENV) or None
+
+def inference_mode():
+    """Inference mode named by R3D18_INFERENCE_MODE, "eager" if unset."""
+    return os.environ.get(INFERENCE_MODE_ENV) or "eager"
+
+def feature_id(layer):
+    """Feature cache id of a layer: the layer name, tagged with the weights file's hash and the inference mode when set."""
+    tags = []
+    if weights_path() is not None:
+        tags.append(content_hash(weights_path())[:12])
+    if inference_mode() != "eager":
+        tags.append(inference_mode())
+    return "-".join([layer] + tags)
+
+def get_extractor():
+    """FeatureExtractor of the selected inference mode, built once per process."""
+    global extractor, extractor_error
+    with extractor_lock:
+        if extractor is None and extractor_error is None:
+            from inference_modes import FeatureExtractor
+            try:
+                extractor = FeatureExtractor(inference_mode())
+            except Exception as e:
+                extractor_error = e
+        if extractor_error is not None:
+            raise extractor_error
+    return extractor
+
+def get_model():
+    """Build R3D18 once per process, with its weights loaded memory-mapped when R3D18_WEIGHTS is set."""
+    global model
+    with model_lock:
+        if model is None:
+            from torchvision.models.video import r3d_18
+
+            if weights_path() is None:
+                model = r3d_18()
+            else:
+                # Build on the meta device (no random initialisation) and adopt the mapped tensors
+                with torch.device("meta"):
+                    network = r3d_18()
+                state_dict = torch.load(weights_path(), mmap=True, weights_only=True, map_location="cpu")
+                network.load_state_dict(state_dict, assign=True)
+                model = network
+    return model
+
+def prepare_model(device=None):
+    """Move the model to the device, switch to eval and register the hooks, once per process."""
+    global device_in_use
+    network = get_model()
+    with model_lock:
+        if device_in_use is None:
+            device_in_use = device if device is not None else get_device()
+            network.to(device_in_use)
+            network.eval()
+
+            # Hooks stay registered for the lifetime of the process
+            network.layer3.register_forward_hook(hook_fn)
+            network.layer4.register_forward_hook(hook_fn)
+            network.avgpool.register_forward_hook(hook_fn)
+    return device_in_use
+
+def extract_features_batch(video_tensors, layers=LAYERS):
+    """Run a batch of (1, C, D, H, W) clips through one forward pass and return a {layer: feature} dict per clip."""
+    for layer in layers:
+        if layer not in LAYERS:
+            raise ValueError(f"Layer {layer} is not supported.")
+
+    if inference_mode() != "eager":
+        with profiler.timer("r3d18_forward"):
+            features = get_extractor()(video_tensors, layers)
+        profiler.count("clips", len(features))
+        return features
+
+    device = prepare_model()
+
+    # Stack the clips into a single (N, C, D, H, W) tensor
+    batch = torch.cat(video_tensors, dim=0).to(device)
 
     # Run the model
-    with torch.no_grad():
-        _ = model(video_tensor)
+    with inference_lock, torch.no_grad(), profiler.timer("r3d18_forward"):
+        _ = model(batch)
 
-    # Remove hooks
-    hook1.remove()
-    hook2.remove()
-    hook3.remove()
+        outputs = {
+            "R3D18-Layer3-512": layer3_output,
+            "R3D18-Layer4-512": layer4_output,
+            "R3D18-AvgPool-512": avgpool_output,
+        }
 
-    # Extract feature
-    match (layer):
-        case "R3D18-Layer3-512":
-            tensor_reshaped = layer3_output.view(1, 256, 2, 4, 14, 14)  # Shape: [1, 256,2, 4, 14, 14]
-            tensor_avg_blocks = tensor_reshaped.mean(dim=[3,4,5])  # Shape: [1, 256, 2]
-            tensor_final = tensor_avg_blocks.view(1, -1)
-        
-        case "R3D18-Layer4-512": 
-            tensor_final = layer4_output.mean(dim=[2,3,4])
-        
-        case "R3D18-AvgPool-512":
-            tensor_final = avgpool_output.view(1, -1)
-        
-    feature_np = tensor_final[0].cpu().numpy()
-    feature_np_rounded = np.round(feature_np, decimals=5)
+    reduced = {layer: np.round(reduce_layer_output(layer, outputs[layer]).cpu().numpy(), decimals=5) for layer in layers}
+
+    profiler.count("clips", batch.shape[0])
+
+    return [{layer: reduced[layer][i] for layer in layers} for i in range(batch.shape[0])]
+
+def extract_features(video_path, layers=LAYERS, use_feature_cache=True):
+    """
+    Decode the video once, run a single forward pass and return {layer: feature} for all requested layers.
+
+    With use_feature_cache, layers already in the feature cache (or in the corpus) are
+    returned without decoding, and newly computed ones are cached.
+    """
+    if use_feature_cache:
+        cached = {layer: feature_cache.lookup(video_path, feature_id(layer)) for layer in layers}
+        if all(feature is not None for feature in cached.values()):
+            return cached
+
+    features = extract_features_batch([load_video(video_path)], layers)[0]
+
+    if use_feature_cache:
+        for layer, feature in features.items():
+            feature_cache.store(video_path, feature_id(layer), feature)
+    return features
 
-    return feature_np_rounded
+def extract_feature(layer, video_path, use_feature_cache=True):
+    """Extract a single layer feature; prefer extract_features when more than one layer is needed."""
+    return extract_features(video_path, [layer], use_feature_cache)[layer]
 
 if __name__ == "__main__":
     
@@ -0,0 +1,77 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import torch
+from feature_extraction import load_video, prepare_model, extract_features_batch
+from profiling import profiler, call_profiled
+
+def init_worker(num_threads):
+    """Load the model once per worker process and keep it resident."""
+    torch.set_num_threads(num_threads)
+    prepare_model()
+
+def process_batch(video_files):
+    """Decode a batch of videos and run them through R3D18 as one (N, C, D, H, W) tensor."""
+    results = []
+    loaded_files = []
+    video_tensors = []
+
+    for video_file in video_files:
+        try:
+            video_tensors.append(load_video(video_file))
+            loaded_files.append(video_file)
+        except Exception as e:
+            print(f"Error processing {video_file}: {e}")
+            results.append((os.path.basename(video_file), video_file, None, None, None))
+
+    if video_tensors:
+        try:
+            batch_features = extract_features_batch(video_tensors)
+        except Exception as e:
+            # A failed forward pass fails only this batch's videos, not the whole build
+            print(f"Error extracting features for {len(loaded_files)} videos: {e}")
+            return results + [(os.path.basename(video_file), video_file, None, None, None) for video_file in loaded_files]
+
+        for video_file, features in zip(loaded_files, batch_features):
+            results.append((os.path.basename(video_file), video_file,
+                            features["R3D18-Layer3-512"],
+                            features["R3D18-Layer4-512"],
+                            features["R3D18-AvgPool-512"]))
+
+    return results
+
+def split_into_batches(items, batch_size):
+    """Split a list into consecutive batches of at most batch_size items."""
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+def run(video_files, batch_size=8, num_workers=None):
+    """
+    Extract Layer3, Layer4 and AvgPool features for all videos, yielding
+    (filename, video_file, layer3, layer4, avgpool) tuples as batches finish.
+
+    Each worker builds R3D18 once and torch threads are split between workers
+    so the pool does not oversubscribe the CPU. Worker timings are merged into
+    this process's profiler.
+    """
+    num_workers = num_workers or os.cpu_count()
+    num_threads = max(1, os.cpu_count() // num_workers)
+    batches = split_into_batches(video_files, batch_size)
+
+    start = time.perf_counter()
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=init_worker, initargs=(num_threads,)) as executor:
+        futures = [executor.submit(call_profiled, process_batch, batch) for batch in batches]
+
+        for future in as_completed(futures):
+            results, snapshot = future.result()
+            profiler.merge(snapshot)
+            done += len(results)
+            elapsed = time.perf_counter() - start
+            print(f"{done}/{len(video_files)} clips, {done / elapsed:.2f} clips/sec")
+            yield from results
+
+    elapsed = time.perf_counter() - start
+    if video_files:
+        print(f"Processed {len(video_files)} clips in {elapsed:.1f}s ({len(video_files) / elapsed:.2f} clips/sec, "
+              f"batch size {batch_size}, {num_workers} workers)")
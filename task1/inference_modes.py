@@ -0,0 +1,200 @@
+import os
+import sys
+import copy
+import glob
+import time
+import argparse
+import warnings
+import numpy as np
+import torch
+from torch import nn
+from tabulate import tabulate
+from feature_extraction import LAYERS, get_model, load_video, reduce_layer_output
+from ann_index import normalize
+
+# R3D18 feature extraction in optimised CPU inference modes, and a check of how far each
+# mode's features drift from the fp32 eager reference:
+#
+#   python task1/inference_modes.py hmdb51_extracted/target_videos/wave --modes eager traced bf16 int8_static
+#
+# Forward hooks do not survive tracing, compilation or quantization, so every mode runs
+# R3D18Features, which returns the three layer outputs directly.
+
+MODES = ["eager", "traced", "compile", "channels_last_3d", "bf16", "int8_static"]
+
+# Modes that can be selected with R3D18_INFERENCE_MODE; int8_static needs calibration clips
+UNCALIBRATED_MODES = [mode for mode in MODES if mode != "int8_static"]
+
+class R3D18Features(nn.Module):
+    """R3D18 trunk that returns the Layer3, Layer4 and AvgPool outputs instead of class scores."""
+
+    def __init__(self, network):
+        super().__init__()
+        self.stem = network.stem
+        self.layer1 = network.layer1
+        self.layer2 = network.layer2
+        self.layer3 = network.layer3
+        self.layer4 = network.layer4
+        self.avgpool = network.avgpool
+
+    def forward(self, x):
+        x = self.layer2(self.layer1(self.stem(x)))
+        layer3 = self.layer3(x)
+        layer4 = self.layer4(layer3)
+        return layer3, layer4, self.avgpool(layer4)
+
+def quantize_static(module, calibration_batch):
+    """Post-training int8 quantization (FX graph mode, x86 backend) calibrated on sample clips."""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = "x86"
+    with warnings.catch_warnings():
+        # FX graph mode quantization is deprecated in favour of torchao, which is not a dependency
+        warnings.simplefilter("ignore")
+        prepared = prepare_fx(module, get_default_qconfig_mapping("x86"), (calibration_batch,))
+        with torch.no_grad():
+            prepared(calibration_batch)
+        return convert_fx(prepared)
+
+class FeatureExtractor:
+    """
+    Extract the Layer3, Layer4 and AvgPool features of clip batches with R3D18 run in one mode:
+
+    - eager: fp32, as extract_features_batch
+    - traced: TorchScript trace, frozen
+    - compile: torch.compile (inductor)
+    - channels_last_3d: fp32 with weights and inputs in NDHWC memory format
+    - bf16: bfloat16 autocast
+    - int8_static: post-training static int8 quantization; needs calibration clips
+
+    The network is copied, so the process-wide model used by extract_features is untouched.
+    """
+
+    def __init__(self, mode="eager", calibration_clips=None):
+        if mode not in MODES:
+            raise ValueError(f"Inference mode '{mode}' is not supported.")
+        if mode == "int8_static" and not calibration_clips:
+            raise ValueError("int8_static needs calibration clips.")
+
+        self.mode = mode
+        module = R3D18Features(copy.deepcopy(get_model())).eval()
+        example = torch.cat(calibration_clips) if calibration_clips else torch.zeros(1, 3, 32, 112, 112)
+
+        if mode == "traced":
+            with torch.no_grad():
+                module = torch.jit.freeze(torch.jit.trace(module, example))
+        elif mode == "compile":
+            module = torch.compile(module)
+        elif mode == "channels_last_3d":
+            module = module.to(memory_format=torch.channels_last_3d)
+        elif mode == "int8_static":
+            module = quantize_static(module, example)
+
+        self.module = module
+
+    def __call__(self, video_tensors, layers=LAYERS):
+        """Run a batch of (1, C, D, H, W) clips and return a {layer: feature} dict per clip, like extract_features_batch."""
+        batch = torch.cat(video_tensors, dim=0)
+        if self.mode == "channels_last_3d":
+            batch = batch.contiguous(memory_format=torch.channels_last_3d)
+
+        with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=self.mode == "bf16"):
+            outputs = dict(zip(LAYERS, self.module(batch)))
+
+        # Back to contiguous fp32 so the layer reductions match the reference
+        reduced = {layer: np.round(reduce_layer_output(layer, outputs[layer].float().contiguous()).numpy(), decimals=5)
+                   for layer in layers}
+
+        return [{layer: reduced[layer][i] for layer in layers} for i in range(batch.shape[0])]
+
+def top_k_neighbours(features, corpus, k):
+    """Indices of the k corpus rows closest by cosine distance to each feature row."""
+    similarities = normalize(features) @ normalize(corpus).T
+    return np.argsort(-similarities, axis=1, kind="stable")[:, :k]
+
+def fidelity(reference, candidate, corpora=None, k=10):
+    """
+    Compare a mode's features against the fp32 eager reference, per layer: the mean and
+    minimum cosine similarity of each clip's two features and, for layers with a corpus
+    matrix in corpora, the mean overlap of their top-k corpus neighbours.
+    """
+    report = {}
+    for layer in LAYERS:
+        reference_features = np.stack([features[layer] for features in reference])
+        candidate_features = np.stack([features[layer] for features in candidate])
+        cosine = np.sum(normalize(reference_features) * normalize(candidate_features), axis=1)
+        report[layer] = {"cosine_mean": float(cosine.mean()), "cosine_min": float(cosine.min())}
+
+        if corpora and layer in corpora:
+            reference_top = top_k_neighbours(reference_features, corpora[layer], k)
+            candidate_top = top_k_neighbours(candidate_features, corpora[layer], k)
+            overlap = [len(set(a) & set(b)) / len(a) for a, b in zip(reference_top, candidate_top)]
+            report[layer]["top_k_overlap"] = float(np.mean(overlap))
+
+    return report
+
+def benchmark(extractor, clips, batch_size):
+    """Run every clip through an extractor after one warm-up batch; returns (features, clips per second)."""
+    batches = [clips[i:i + batch_size] for i in range(0, len(clips), batch_size)]
+    extractor(batches[0])
+
+    features = []
+    start = time.perf_counter()
+    for batch in batches:
+        features.extend(extractor(batch))
+    return features, len(clips) / (time.perf_counter() - start)
+
+def main():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from compare_features import load_features_from_csv
+
+    parser = argparse.ArgumentParser(description="Compare the speed and feature fidelity of the R3D18 inference modes.")
+    parser.add_argument("videos", nargs="+", help="Video files or folders of videos used as sample clips")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--clips", type=int, default=16, help="Sample clips to use")
+    parser.add_argument("--calibration-clips", type=int, default=4, help="Clips used to calibrate int8_static")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared for the top-k overlap")
+    args = parser.parse_args()
+
+    video_files = []
+    for path in args.videos:
+        video_files.extend(sorted(glob.glob(os.path.join(path, "**", "*.avi"), recursive=True)) if os.path.isdir(path) else [path])
+    clips = [load_video(video_file) for video_file in video_files[:args.clips]]
+    if not clips:
+        parser.error("No videos found")
+
+    # Corpus neighbours are ranked against the stored features; run from the repository root
+    corpora = {}
+    for layer in LAYERS:
+        try:
+            corpora[layer] = load_features_from_csv(layer)[2]
+        except FileNotFoundError as e:
+            print(f"No corpus for {layer}, top-k overlap skipped: {e}")
+
+    print(f"Reference: eager fp32 on {len(clips)} clips")
+    reference, reference_speed = benchmark(FeatureExtractor("eager"), clips, args.batch_size)
+
+    table = []
+    for mode in args.modes:
+        try:
+            extractor = FeatureExtractor(mode, clips[:args.calibration_clips])
+            features, speed = benchmark(extractor, clips, args.batch_size)
+        except Exception as e:
+            print(f"{mode} failed: {type(e).__name__}: {e}")
+            continue
+
+        report = fidelity(reference, features, corpora, args.k)
+        row = [mode, f"{speed:.2f}", f"{speed / reference_speed:.2f}x"]
+        for layer in LAYERS:
+            overlap = report[layer].get("top_k_overlap")
+            row.append(f"{report[layer]['cosine_mean']:.4f} / {report[layer]['cosine_min']:.4f}"
+                       + (f", {overlap:.2f}" if overlap is not None else ""))
+        table.append(row)
+
+    headers = ["Mode", "Clips/sec", "Speedup"] + [f"{layer}\ncosine mean / min, top-{args.k}" for layer in LAYERS]
+    print(tabulate(table, headers=headers, tablefmt="grid"))
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,21 @@
 import os
+import sys
+import time
 import glob
+import argparse
 import pandas as pd
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from feature_extraction import extract_feature
-
-def process_video(video_file):
-    """Process a single video file and return extracted features."""
-    filename = os.path.basename(video_file)
-    try:
-        feature_layer3 = extract_feature("R3D18-Layer3-512", video_file)
-        feature_layer4 = extract_feature("R3D18-Layer4-512", video_file)
-        feature_avgpool = extract_feature("R3D18-AvgPool-512", video_file)
-
-        # Collect features with video filename and filepath
-        return (filename, video_file, feature_layer3, feature_layer4, feature_avgpool)
-    except Exception as e:
-        print(f"Error processing {video_file}: {e}")
-        return (filename, video_file, None, None, None)
+import inference_engine
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from manifest import prepare_incremental_build
+from profiling import profiler
+
+OUTPUT_FILES = {
+    "R3D18-Layer3-512": "features_layer3.csv",
+    "R3D18-Layer4-512": "features_layer4.csv",
+    "R3D18-AvgPool-512": "features_avgpool.csv",
+}
+MANIFEST_FILE = "features.manifest.json"
 
 def save_to_csv(data, file_path, columns):
     """Save data to CSV file, appending if the file exists."""
@@ -27,47 +26,73 @@ def save_to_csv(data, file_path, columns):
     else:
         df.to_csv(file_path, mode='a', header=False, index=False)  # Append without header if file exists
 
-def process_folder(folder_path):
-    """Process all video files in a folder and append features to CSV."""
-    video_files = glob.glob(os.path.join(folder_path, "*.avi"))  # Adjust file extension if needed
-    
-    features_layer3 = []
-    features_layer4 = []
-    features_avgpool = []
-
-    with ProcessPoolExecutor() as executor:
-        future_to_video = {executor.submit(process_video, video_file): video_file for video_file in video_files}
-        
-        for future in as_completed(future_to_video):
-            filename, video_file, feature_layer3, feature_layer4, feature_avgpool = future.result()
-            
-            if feature_layer3 is not None:
-                features_layer3.append([filename, video_file] + list(feature_layer3.flatten()))
-            if feature_layer4 is not None:
-                features_layer4.append([filename, video_file] + list(feature_layer4.flatten()))
-            if feature_avgpool is not None:
-                features_avgpool.append([filename, video_file] + list(feature_avgpool.flatten()))
-
-    # Define column names
-    if features_layer3:
-        columns_layer3 = ['filename', 'filepath'] + [f"feature_{i}" for i in range(len(features_layer3[0]) - 2)]
-        save_to_csv(features_layer3, "features_layer3.csv", columns_layer3)
-    
-    if features_layer4:
-        columns_layer4 = ['filename', 'filepath'] + [f"feature_{i}" for i in range(len(features_layer4[0]) - 2)]
-        save_to_csv(features_layer4, "features_layer4.csv", columns_layer4)
-    
-    if features_avgpool:
-        columns_avgpool = ['filename', 'filepath'] + [f"feature_{i}" for i in range(len(features_avgpool[0]) - 2)]
-        save_to_csv(features_avgpool, "features_avgpool.csv", columns_avgpool)
+def save_features(rows):
+    """Append the rows of each layer to its CSV file."""
+    for layer, layer_rows in rows.items():
+        if layer_rows:
+            columns = ['filename', 'filepath'] + [f"feature_{i}" for i in range(len(layer_rows[0]) - 2)]
+            save_to_csv(layer_rows, OUTPUT_FILES[layer], columns)
+
+def process_videos(video_files, batch_size=8, num_workers=None, chunk_size=64):
+    """
+    Extract features for the new or changed video files with the batched engine.
+
+    Results are committed every chunk_size videos: rows are appended to the CSVs and
+    the videos are then recorded in the manifest, so an interrupted run resumes
+    after the last committed chunk.
+    """
+    manifest, pending = prepare_incremental_build(MANIFEST_FILE, video_files, OUTPUT_FILES.values())
+    if not pending:
+        return
+
+    rows = {layer: [] for layer in OUTPUT_FILES}
+    done = []
+
+    def commit():
+        save_features(rows)
+        manifest.record(done)
+        manifest.save()
+        for layer_rows in rows.values():
+            layer_rows.clear()
+        done.clear()
+
+    for filename, video_file, feature_layer3, feature_layer4, feature_avgpool in inference_engine.run(pending, batch_size, num_workers):
+        # Failed videos stay out of the manifest and are retried on the next run
+        if feature_layer3 is None:
+            continue
+
+        rows["R3D18-Layer3-512"].append([filename, video_file] + list(feature_layer3.flatten()))
+        rows["R3D18-Layer4-512"].append([filename, video_file] + list(feature_layer4.flatten()))
+        rows["R3D18-AvgPool-512"].append([filename, video_file] + list(feature_avgpool.flatten()))
+        done.append(video_file)
+
+        if len(done) >= chunk_size:
+            commit()
+
+    commit()
 
 def main():
-    base_dir = "../hmdb51_extracted/target_videos/"
-    folders = [f for f in glob.glob(os.path.join(base_dir, '*')) if os.path.isdir(f)]
+    parser = argparse.ArgumentParser(description="Extract R3D18 features for all target videos.")
+    parser.add_argument("base_dir", nargs="?", default="../hmdb51_extracted/target_videos/")
+    parser.add_argument("--batch-size", type=int, default=8, help="Clips per forward pass")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Videos per committed chunk")
+    parser.add_argument("--profile", nargs="?", const="build_profile.json", help="Write a JSON timing breakdown of the build")
+    args = parser.parse_args()
+
+    folders = [f for f in glob.glob(os.path.join(args.base_dir, '*')) if os.path.isdir(f)]
 
+    # One pool for every folder so the model stays resident in each worker
+    video_files = []
     for folder in folders:
-        print(f"Processing folder: {folder}")
-        process_folder(folder)
+        video_files.extend(glob.glob(os.path.join(folder, "*.avi")))  # Adjust file extension if needed
+
+    print(f"Found {len(video_files)} videos in {len(folders)} folders")
+    start = time.perf_counter()
+    process_videos(video_files, args.batch_size, args.workers, args.chunk_size)
+
+    if args.profile:
+        profiler.write_json(args.profile, build="R3D18", videos=len(video_files), wall_seconds=time.perf_counter() - start)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
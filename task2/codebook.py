@@ -0,0 +1,101 @@
+import os
+import sys
+import hashlib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from profiling import profiler
+from stip_reader import (SIGMAS, TAUS, PAIRS, SIGMA_COLUMN, TAU_COLUMN, CONFIDENCE_COLUMN,
+                         HOG_COLUMNS, HOF_COLUMNS, StipData)  # Re-exported for the codebook users
+
+N_CLUSTERS = 40
+HISTOGRAM_SIZE = len(PAIRS) * N_CLUSTERS  # 480 per descriptor
+TOP_PER_PAIR = 400  # STIPs kept per (sigma, tau) pair, see StipData.top_pair_rows
+
+class Codebook:
+    """HoG and HoF cluster centers per (sigma, tau) pair, kept as contiguous arrays with precomputed norms."""
+
+    def __init__(self, hog_centers, hof_centers):
+        # {(sigma, tau): (centers, squared norms)}
+        self.hog = {pair: (centers, np.einsum('ij,ij->i', centers, centers)) for pair, centers in hog_centers.items()}
+        self.hof = {pair: (centers, np.einsum('ij,ij->i', centers, centers)) for pair, centers in hof_centers.items()}
+
+        # Identifies the centers, so histograms cached with another codebook are not reused
+        digest = hashlib.sha1()
+        for centers in [hog_centers, hof_centers]:
+            for pair in sorted(centers):
+                digest.update(np.ascontiguousarray(centers[pair], dtype=np.float32).tobytes())
+        self.digest = digest.hexdigest()[:12]
+
+    @classmethod
+    def from_csv(cls, hog_cluster_file, hof_cluster_file):
+        """Load the combined cluster center files written by task2a."""
+        hog_centers_df = pd.read_csv(hog_cluster_file)
+        hof_centers_df = pd.read_csv(hof_cluster_file)
+
+        hog_centers = {}
+        hof_centers = {}
+        for sigma, tau in PAIRS:
+            hog_rows = (hog_centers_df['sigma'] == sigma) & (hog_centers_df['tau'] == tau)
+            hof_rows = (hof_centers_df['sigma'] == sigma) & (hof_centers_df['tau'] == tau)
+            hog_centers[(sigma, tau)] = np.ascontiguousarray(hog_centers_df[hog_rows].iloc[:, 3:75].values, dtype=np.float32)
+            hof_centers[(sigma, tau)] = np.ascontiguousarray(hof_centers_df[hof_rows].iloc[:, 3:93].values, dtype=np.float32)
+
+        return cls(hog_centers, hof_centers)
+
+    def quantize(self, stip_data):
+        """Quantize one video's STIPs (StipData or raw STIP array) into a 960-float HoG + HoF histogram vector."""
+        return self.quantize_batch([stip_data])[0]
+
+    @profiler.timed("bof_quantize")
+    def quantize_batch(self, stip_arrays):
+        """
+        Quantize several videos' STIPs (StipData or raw STIP arrays) into a (videos, 960) matrix.
+
+        Each (sigma, tau) pair is handled in one pass over all videos: the selected
+        STIPs of every video are stacked and assigned to their nearest centers with a
+        single matmul. Histograms of the pairs a video has are packed in pair order.
+        A single video's rows are used in place, without copying.
+        """
+        stips = [stip if isinstance(stip, StipData) else StipData.from_array(stip) for stip in stip_arrays]
+
+        num_videos = len(stips)
+        hog_histograms = np.zeros((num_videos, HISTOGRAM_SIZE))
+        hof_histograms = np.zeros((num_videos, HISTOGRAM_SIZE))
+        next_position = np.zeros(num_videos, dtype=int)
+        present = [set(stip.pairs()) for stip in stips]
+
+        for pair in PAIRS:
+            videos = np.array([i for i, pairs in enumerate(present) if pair in pairs], dtype=int)
+            if len(videos) == 0:
+                continue
+
+            rows = [stips[i].top_pair_rows(pair, TOP_PER_PAIR) for i in videos]
+            counts = np.array([len(hog) for hog, _ in rows])
+            owner = np.repeat(np.arange(len(videos)), counts)
+
+            hog_labels = self._nearest_centers(self._stack([hog for hog, _ in rows]), *self.hog[pair])
+            hof_labels = self._nearest_centers(self._stack([hof for _, hof in rows]), *self.hof[pair])
+
+            hog_counts = np.bincount(owner * N_CLUSTERS + hog_labels, minlength=len(videos) * N_CLUSTERS)
+            hof_counts = np.bincount(owner * N_CLUSTERS + hof_labels, minlength=len(videos) * N_CLUSTERS)
+
+            # Place each video's 40 bins at its next free position
+            positions = next_position[videos][:, None] + np.arange(N_CLUSTERS)
+            hog_histograms[videos[:, None], positions] = hog_counts.reshape(len(videos), N_CLUSTERS)
+            hof_histograms[videos[:, None], positions] = hof_counts.reshape(len(videos), N_CLUSTERS)
+            next_position[videos] += N_CLUSTERS
+
+        return np.hstack([hog_histograms, hof_histograms])
+
+    @staticmethod
+    def _stack(arrays):
+        """Concatenate row blocks, passing a single block through as it is."""
+        return arrays[0] if len(arrays) == 1 else np.concatenate(arrays)
+
+    @staticmethod
+    def _nearest_centers(features, centers, center_norms):
+        """Index of the closest center for every feature row; |x|^2 is dropped as it does not change the argmin."""
+        distances = center_norms[None, :] - 2.0 * (features @ centers.T)
+        return np.argmin(distances, axis=1)
@@ -1,18 +1,22 @@
-import pandas as pd
+import os
+import sys
 import numpy as np
 from scipy.spatial.distance import cdist
-from get_features import process_file
+from get_features import compute_bof_vector
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from feature_store import load_features
+from profiling import profiler
 
 def calculate_distances(hog_histogram, hof_histogram, csv_file):
     """Calculate Euclidean distances between the given histograms and those in the CSV file."""
     
-    # Load the precomputed HoG and HoF histograms from the CSV file
-    data = pd.read_csv(csv_file)
+    # Load the precomputed HoG and HoF histograms from the feature store of the CSV file
+    filenames, _, histograms = load_features(csv_file)
 
-    # Extract filenames, HoG, and HoF histograms
-    filenames = data['video_name'].values
-    hog_histograms = data.iloc[:, 2:482].values  # HoG for 480 values (from column 2 to 482)
-    hof_histograms = data.iloc[:, 482:962].values  # HoF for 480 values (from column 482 to 962)
+    # Split into HoG and HoF histograms
+    hog_histograms = histograms[:, 0:480]  # HoG for 480 values (CSV columns 2 to 482)
+    hof_histograms = histograms[:, 480:960]  # HoF for 480 values (CSV columns 482 to 962)
 
     # Stack the target HoG and HoF histograms for the input video
     combined_histogram = np.hstack([hog_histogram, hof_histogram]).reshape(1, -1)
@@ -21,7 +25,9 @@ def calculate_distances(hog_histogram, hof_histogram, csv_file):
     combined_histograms_csv = np.hstack([hog_histograms, hof_histograms])
 
     # Compute the Euclidean distance between the input video and all other videos
-    distances = cdist(combined_histogram, combined_histograms_csv, metric='euclidean').flatten()
+    with profiler.timer("distance"):
+        distances = cdist(combined_histogram, combined_histograms_csv, metric='euclidean').flatten()
+        profiler.count("rows_scored", len(distances))
 
     # Pair filenames with distances
     distance_results = list(zip(filenames, distances))
@@ -40,16 +46,16 @@ def bof_960(video_path, csv_file, k):
     if "hmdb51_extracted" in video_path:
         video_path = video_path.replace("hmdb51_extracted", "hmdb51_org_stips")
     
-    # Step 1: Extract HoG and HoF features for the given video
-    histogram_data = process_file(video_path)
+    # Step 1: Extract the 960-bin HoG and HoF histogram vector for the given video
+    histogram = compute_bof_vector(video_path)
     
-    if histogram_data is None:
+    if histogram is None:
         print(f"Failed to extract histograms for video: {video_path}")
         return []
     
-    # Extract HoG and HoF histograms from the processed data
-    hog_histogram = np.array([histogram_data[f'hog_histogram_bin_{i}'] for i in range(480)])
-    hof_histogram = np.array([histogram_data[f'hof_histogram_bin_{i}'] for i in range(480)])
+    # Split into HoG and HoF histograms
+    hog_histogram = histogram[:480]
+    hof_histogram = histogram[480:]
     
     # Step 2: Calculate the distances between this video and all others in the CSV
     distances = calculate_distances(hog_histogram, hof_histogram, csv_file)
@@ -1,125 +1,73 @@
 import os
-import numpy as np
+from functools import lru_cache
 import pandas as pd
-from scipy.spatial.distance import cdist
-
-def read_stip_file(file_path):
-    """Read STIP data from the file."""
-    data = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            if line.startswith('#'):
-                continue
-            parts = line.strip().split()
-            if parts:
-                data.append([float(x) for x in parts])
-
-    data_array = np.array(data)
-    return data_array
-
-def read_stip_file_to_dataframe(file_path):
-    """Convert STIP data from file to a DataFrame."""
+from stip_reader import read_stip_file
+from codebook import Codebook
+from feature_cache import feature_cache
+
+# Hardcoded cluster center file paths
+HOG_CLUSTER_FILE = './kmeans_results/combined_hog_cluster_centers.csv'
+HOF_CLUSTER_FILE = './kmeans_results/combined_hof_cluster_centers.csv'
+
+@lru_cache(maxsize=None)
+def get_codebook(hog_cluster_file=HOG_CLUSTER_FILE, hof_cluster_file=HOF_CLUSTER_FILE):
+    """Load the HoG/HoF codebook once per process."""
+    return Codebook.from_csv(hog_cluster_file, hof_cluster_file)
+
+def stip_file_path(file_path):
+    """Map a video path under hmdb51_extracted to its STIP file under hmdb51_org_stips."""
+    if 'hmdb51_extracted' in file_path:
+        file_path = file_path.replace('hmdb51_extracted', 'hmdb51_org_stips')
+    return file_path
+
+def compute_bof_vector(file_path, cache=False, use_feature_cache=True):
+    """
+    Return the 960-float HoG + HoF histogram vector of a STIP file, or None if it cannot be read.
+
+    With use_feature_cache, the vector is looked up in the feature cache by the STIP
+    file's content hash and the codebook, and cached after it is computed.
+    """
+    file_path = stip_file_path(file_path)
+
+    model = f"BOF-960-{get_codebook().digest}"
+    if use_feature_cache and os.path.exists(file_path):
+        histogram = feature_cache.lookup(file_path, model)
+        if histogram is not None:
+            return histogram
+
     try:
-        stip_data = read_stip_file(file_path)
-
-        if stip_data.size == 0:
-            print(f"File is empty: {file_path}")
-            return None
-
-        # Extract relevant columns (sigma2, tau2, HOG, HOF)
-        col5 = stip_data[:, 4]  # sigma2 column (5th)
-        col6 = stip_data[:, 5]  # tau2 column (6th)
-        col8_80 = stip_data[:, 7:79]  # 8th to 80th columns (HOG)
-        col81_171 = stip_data[:, 79:170]  # 81st to 171st columns (HOF)
-
-        # Create a DataFrame with the relevant columns
-        df = pd.DataFrame({
-            'confidence': stip_data[:, 5],  # Confidence is in the first column
-            'sigma2': col5,
-            'tau2': col6,
-            'hog': list(col8_80),
-            'hof': list(col81_171)
-        })
-
-        return df
-
-    except IndexError as idx_error:
-        print(f"IndexError processing {file_path}: {idx_error}")
-        return None
+        stip_data = read_stip_file(file_path, cache)
     except Exception as e:
         print(f"Error processing {file_path}: {e}")
         return None
 
-def compute_histogram(features, cluster_centers):
-    """Compute a histogram by finding the closest cluster center."""
-    distances = cdist(features, cluster_centers, metric='euclidean')
-    closest_clusters = np.argmin(distances, axis=1)
-    histogram, _ = np.histogram(closest_clusters, bins=np.arange(41))
+    if stip_data.size == 0:
+        print(f"File is empty: {file_path}")
+        return None
+
+    histogram = get_codebook().quantize(stip_data)
+
+    if use_feature_cache:
+        feature_cache.store(file_path, model, histogram)
     return histogram
 
-def process_file(file_path):
-    """Process a single file and return a DataFrame containing HoG and HoF histograms."""
-    
-    # Replace 'hmdbmi_extracted' with 'hmdb51_org_stips' if found in the file path
-    if 'hmdb51_extracted' in file_path:
-        file_path = file_path.replace('hmdb51_extracted', 'hmdb51_org_stips')
-    
-    # Hardcoded cluster center file paths
-    hog_cluster_file = './kmeans_results/combined_hog_cluster_centers.csv'
-    hof_cluster_file = './kmeans_results/combined_hof_cluster_centers.csv'
-    
-    hog_centers_df, hof_centers_df = load_cluster_centers(hog_cluster_file, hof_cluster_file)
+def process_file(file_path, cache=False):
+    """Process a single file and return a DataFrame containing HoG and HoF histograms.
+
+    cache=True keeps a binary copy of the parsed STIP file for later runs.
+    """
+    file_path = stip_file_path(file_path)
 
-    stip_df = read_stip_file_to_dataframe(file_path)
+    histogram = compute_bof_vector(file_path, cache, use_feature_cache=False)
     
-    if stip_df is None:
+    if histogram is None:
         return None
 
-    hog_combined_histogram = np.zeros(480)  # Initialize a 480-length array for the combined HoG histogram
-    hof_combined_histogram = np.zeros(480)  # Initialize a 480-length array for the combined HoF histogram
-    index = 0  # To keep track of the position in the histograms
-
-    # Process histograms for each sigma and tau pair
-    for sigma in [4, 8, 16, 32, 64, 128]:
-        for tau in [2, 4]:
-            # Filter by sigma and tau pair
-            filtered_df = stip_df[(stip_df['sigma2'] == sigma) & (stip_df['tau2'] == tau)]
-            
-            if not filtered_df.empty:
-                # Sort the filtered data by confidence in descending order and select the top 400
-                filtered_df_sorted = filtered_df.sort_values(by='confidence', ascending=False)
-                top_400_filtered_df = filtered_df_sorted.head(400)
-                
-                # Extract corresponding cluster centers for HoG and HoF
-                hog_centers = hog_centers_df[(hog_centers_df['sigma'] == sigma) & 
-                                             (hog_centers_df['tau'] == tau)].iloc[:, 3:75].values
-                hof_centers = hof_centers_df[(hof_centers_df['sigma'] == sigma) & 
-                                             (hof_centers_df['tau'] == tau)].iloc[:, 3:93].values
-                
-                # Get the HoG and HoF features from the top 400 filtered data
-                hog_features = np.vstack(top_400_filtered_df['hog'].values)
-                hof_features = np.vstack(top_400_filtered_df['hof'].values)
-                
-                # Compute the histograms for the HoG and HoF features
-                hog_histogram = compute_histogram(hog_features, hog_centers)
-                hof_histogram = compute_histogram(hof_features, hof_centers)
-                
-                # Place the 40-bin histogram in the correct position of the 480-length combined histogram
-                hog_combined_histogram[index:index + 40] = hog_histogram
-                hof_combined_histogram[index:index + 40] = hof_histogram
-                index += 40  # Move the index forward by 40 for the next (sigma, tau) pair
-
     # Extract video name from file path (for example: the file name without extension)
     video_name = os.path.basename(file_path).split('.')[0]
 
     # Create a DataFrame with the required format and return
-    return create_histogram_df(video_name, file_path, hog_combined_histogram, hof_combined_histogram)
-
-def load_cluster_centers(hog_cluster_file, hof_cluster_file):
-    """Load the precomputed cluster centers from the files."""
-    hog_centers_df = pd.read_csv(hog_cluster_file)
-    hof_centers_df = pd.read_csv(hof_cluster_file)
-    return hog_centers_df, hof_centers_df
+    return create_histogram_df(video_name, file_path, histogram[:480], histogram[480:])
 
 def create_histogram_df(video_name, video_path, hog_histogram, hof_histogram):
     """Create a DataFrame row in the desired format."""
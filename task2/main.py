@@ -1,59 +1,106 @@
 import os
+import sys
+import csv
 import glob
-import pandas as pd
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from task2.get_histogram_for_file import process_file, load_cluster_centers
-
-def process_folder(folder_path, hog_centers_df, hof_centers_df):
-    """Process all files in a folder and return histograms for each video file."""
-    # Get a list of all text files in the folder
-    files = glob.glob(os.path.join(folder_path, "*.txt"))
-
-    folder_histograms = []
-    
-    # Use ProcessPoolExecutor to parallelize file processing
-    with ProcessPoolExecutor() as executor:
-        future_to_file = {executor.submit(process_file, file, hog_centers_df, hof_centers_df): file for file in files}
-        for future in as_completed(future_to_file):
-            result = future.result()
-            if result:
-                folder_histograms.append(result)
-
-    return folder_histograms
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from get_histogram_for_file import process_file
+from codebook import Codebook, HISTOGRAM_SIZE
+from profiling import profiler, call_profiled
+
+# Codebook of the worker process, loaded once by init_worker
+worker_codebook = None
+
+def init_worker(hog_cluster_file, hof_cluster_file):
+    """Load the cluster centers once per worker instead of pickling them with every task."""
+    global worker_codebook
+    worker_codebook = Codebook.from_csv(hog_cluster_file, hof_cluster_file)
+
+def process_chunk(files, cache=True):
+    """Process a chunk of STIP files in a worker and return the histogram rows of the readable ones."""
+    rows = []
+    for file in files:
+        result = process_file(file, worker_codebook, cache)
+        if result:
+            rows.append(result)
+    return rows
+
+def split_into_chunks(items, chunk_size):
+    """Split a list into consecutive chunks of at most chunk_size items."""
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+def build_histograms(files, output_file, hog_cluster_file, hof_cluster_file, num_workers=None, chunk_size=32):
+    """
+    Compute the histograms of all STIP files with one flat pool and stream them to a CSV.
+
+    Files are submitted in chunks, with at most two chunks per worker in flight, and
+    rows are written as soon as their chunk completes. Worker timings are merged into
+    this process's profiler.
+    """
+    num_workers = num_workers or os.cpu_count()
+    chunks = iter(split_into_chunks(files, chunk_size))
+    columns = (['video_name', 'video_path'] + [f'hog_histogram_bin_{i}' for i in range(HISTOGRAM_SIZE)] +
+               [f'hof_histogram_bin_{i}' for i in range(HISTOGRAM_SIZE)])
+    written = 0
+
+    with open(output_file, mode='w', newline='') as file, \
+         ProcessPoolExecutor(max_workers=num_workers, initializer=init_worker,
+                             initargs=(hog_cluster_file, hof_cluster_file)) as executor:
+        writer = csv.DictWriter(file, fieldnames=columns)
+        writer.writeheader()
+
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(call_profiled, process_chunk, chunk))
+            if len(pending) >= 2 * num_workers:
+                break
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                rows, snapshot = future.result()
+                profiler.merge(snapshot)
+                writer.writerows(rows)
+                written += len(rows)
+
+                # Keep the pool fed without queueing every chunk up front
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    pending.add(executor.submit(call_profiled, process_chunk, next_chunk))
+
+            file.flush()
+            print(f"{written}/{len(files)} files written")
+
+    return written
 
 def main():
+    parser = argparse.ArgumentParser(description="Compute the combined HoG/HoF histograms of all STIP files.")
     # Directory path for the video folders
-    base_dir = "./hmdb51_org_stips/target_videos/"
-    
+    parser.add_argument("base_dir", nargs="?", default="./hmdb51_org_stips/target_videos/")
     # Paths to the combined cluster centers
-    hog_cluster_file = 'kmeans_results/combined_hog_cluster_centers.csv'
-    hof_cluster_file = 'kmeans_results/combined_hof_cluster_centers.csv'
-    
-    # Load the cluster centers
-    hog_centers_df, hof_centers_df = load_cluster_centers(hog_cluster_file, hof_cluster_file)
-    
-    # Get a list of all subdirectories in the base directory
-    folders = [f for f in glob.glob(os.path.join(base_dir, '*')) if os.path.isdir(f)]
-    
-    # Create a directory to save the results
-    output_file = "combined_histograms.csv"
-
-    # Process each folder in parallel and collect histograms
-    all_histograms = []
-
-    # Use ProcessPoolExecutor to parallelize folder processing
-    with ProcessPoolExecutor() as executor:
-        future_to_folder = {executor.submit(process_folder, folder, hog_centers_df, hof_centers_df): folder for folder in folders}
-        for future in as_completed(future_to_folder):
-            result = future.result()
-            if result:
-                all_histograms.extend(result)
-
-    # Create DataFrame and save to CSV
-    histograms_df = pd.DataFrame(all_histograms)
-    histograms_df.to_csv(output_file, index=False)
-
-    print(f"Saved combined histograms to {output_file}")
+    parser.add_argument("--hog-centers", default='kmeans_results/combined_hog_cluster_centers.csv')
+    parser.add_argument("--hof-centers", default='kmeans_results/combined_hof_cluster_centers.csv')
+    parser.add_argument("--output", default="combined_histograms.csv")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="STIP files per task")
+    parser.add_argument("--profile", nargs="?", const="build_profile.json", help="Write a JSON timing breakdown of the build")
+    args = parser.parse_args()
+
+    # One flat list of every STIP file in every class folder
+    files = sorted(glob.glob(os.path.join(args.base_dir, '*', '*.txt')))
+    print(f"Processing {len(files)} STIP files")
+
+    start = time.perf_counter()
+    written = build_histograms(files, args.output, args.hog_centers, args.hof_centers, args.workers, args.chunk_size)
+
+    print(f"Saved {written} combined histograms to {args.output}")
+
+    if args.profile:
+        profiler.write_json(args.profile, build="BOF-960", files=len(files), wall_seconds=time.perf_counter() - start)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,135 @@
+import os
+import sys
+import warnings
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from profiling import profiler
+
+# (sigma, tau) pairs in the order their 40-bin histograms are laid out
+SIGMAS = [4, 8, 16, 32, 64, 128]
+TAUS = [2, 4]
+PAIRS = [(sigma, tau) for sigma in SIGMAS for tau in TAUS]
+
+# STIP columns: point-type x y t sigma2 tau2 detector-confidence dscr-hog(72) dscr-hof(90)
+SIGMA_COLUMN = 4
+TAU_COLUMN = 5
+CONFIDENCE_COLUMN = 6
+HOG_COLUMNS = slice(7, 79)
+HOF_COLUMNS = slice(79, 170)
+HOG_SIZE = HOG_COLUMNS.stop - HOG_COLUMNS.start
+HOF_SIZE = 90
+
+def stip_cache_path(file_path):
+    """Return the path of the binary cache kept next to a STIP text file."""
+    return file_path + ".npy"
+
+@profiler.timed("read_stip_file")
+def read_stip_file(file_path, cache=False):
+    """
+    Read STIP data from the file as a float32 (rows, columns) array, skipping '#' comment lines.
+
+    With cache=True the parsed array is also saved next to the text file and reused
+    on later reads for as long as it is not older than the text file. A cache that
+    cannot be loaded is parsed again and rewritten.
+    """
+    cache_path = stip_cache_path(file_path)
+
+    if cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(file_path):
+        try:
+            data_array = np.load(cache_path)
+            profiler.count("bytes_read", os.path.getsize(cache_path))
+            return data_array
+        except (OSError, ValueError, EOFError) as e:
+            print(f"Could not read {cache_path}, parsing {file_path} again: {e}")
+
+    # np.loadtxt parses in C; empty files only raise a warning and give an empty array
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        data_array = np.loadtxt(file_path, dtype=np.float32, comments='#', ndmin=2)
+    profiler.count("bytes_read", os.path.getsize(file_path))
+    profiler.count("stip_rows", len(data_array))
+
+    if cache:
+        # Write to a temporary file first so a reader never loads a half-written cache
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+        try:
+            np.save(tmp_path, data_array)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Could not cache {file_path}: {e}")
+
+    return data_array
+
+class StipData:
+    """
+    Columnar STIPs of one video: contiguous float32 HoG (rows, 72) and HoF (rows, 90)
+    matrices and sigma, tau and confidence columns, with the rows grouped by
+    (sigma, tau) pair in PAIRS order. Rows offsets[i]:offsets[i + 1] belong to PAIRS[i]
+    and keep their file order; rows with any other (sigma, tau) are dropped.
+    """
+
+    def __init__(self, sigma, tau, confidence, hog, hof, offsets):
+        self.sigma = sigma
+        self.tau = tau
+        self.confidence = confidence
+        self.hog = hog
+        self.hof = hof
+        self.offsets = offsets
+
+    @classmethod
+    def from_array(cls, stip_data):
+        """Group the rows of a STIP array as returned by read_stip_file."""
+        if stip_data.size == 0:
+            empty = np.empty(0, dtype=np.float32)
+            return cls(empty, empty, empty, np.empty((0, HOG_SIZE), dtype=np.float32),
+                       np.empty((0, HOF_SIZE), dtype=np.float32), np.zeros(len(PAIRS) + 1, dtype=np.int64))
+
+        pair_index = np.full(len(stip_data), len(PAIRS))
+        for i, (sigma, tau) in enumerate(PAIRS):
+            pair_index[(stip_data[:, SIGMA_COLUMN] == sigma) & (stip_data[:, TAU_COLUMN] == tau)] = i
+
+        # One stable sort groups the pairs; each column block is gathered straight into its own array
+        order = np.argsort(pair_index, kind='stable')
+        offsets = np.searchsorted(pair_index[order], np.arange(len(PAIRS) + 1))
+        order = order[:offsets[-1]]
+        stip_data = stip_data.astype(np.float32, copy=False)
+
+        return cls(stip_data[order, SIGMA_COLUMN], stip_data[order, TAU_COLUMN], stip_data[order, CONFIDENCE_COLUMN],
+                   stip_data[order, HOG_COLUMNS], stip_data[order, HOF_COLUMNS], offsets)
+
+    def __len__(self):
+        return len(self.confidence)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in [self.sigma, self.tau, self.confidence, self.hog, self.hof, self.offsets])
+
+    def pair_slice(self, pair):
+        """Row range of a (sigma, tau) pair."""
+        i = PAIRS.index(pair)
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def pairs(self):
+        """The (sigma, tau) pairs that have at least one row."""
+        return [pair for i, pair in enumerate(PAIRS) if self.offsets[i + 1] > self.offsets[i]]
+
+    def pair_rows(self, pair):
+        """(HoG, HoF, confidence) views of the rows of a pair."""
+        rows = self.pair_slice(pair)
+        return self.hog[rows], self.hof[rows], self.confidence[rows]
+
+    def top_pair_rows(self, pair, n):
+        """
+        (HoG, HoF) views of the first n rows of a pair in file order.
+
+        This is the selection the corpus histograms were built with: the original code
+        sorted each pair's rows by a 'confidence' column that actually held tau, which
+        is constant within a pair, so the sort kept the file order.
+        """
+        rows = self.pair_slice(pair)
+        return self.hog[rows][:n], self.hof[rows][:n]
+
+def read_stip_data(file_path, cache=False):
+    """Read a STIP file into a StipData container."""
+    return StipData.from_array(read_stip_file(file_path, cache))
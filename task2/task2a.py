@@ -1,180 +1,163 @@
-#ignore this it earlier code, might remove later
 import os
 import glob
+import argparse
 import numpy as np
 import pandas as pd
 from concurrent.futures import ProcessPoolExecutor, as_completed
-from sklearn.cluster import KMeans
-import sys
-
-def read_stip_file(file_path):
-    """Read STIP data from the file."""
-    data = []
-    with open(file_path, 'r') as file:
-        for line in file:
-            if line.startswith('#'):
-                continue
-            parts = line.strip().split()
-            if parts:
-                data.append([float(x) for x in parts])
-
-    data_array = np.array(data)
-    return data_array
-
-def read_stip_file_to_dataframe(file_path):
-    """Convert STIP data from file to a DataFrame and select top 400 by confidence."""
-    try:
-        stip_data = read_stip_file(file_path)
-
-        # Check if the file is empty
-        if stip_data.size == 0:
-            print(f"File is empty: {file_path}")
-            return None
-
-        # Sort by detector confidence (assuming it's in the first column)
-        stip_data_sorted = stip_data[stip_data[:, 6].argsort()[::-1]]  # Sort in descending order of confidence
-
-        # Select top 400 descriptors based on confidence
-        top_400_stip_data = stip_data_sorted[:400]
-
-        # Extract columns
-        col5 = top_400_stip_data[:, 4]  # 5th column (index 4)
-        col6 = top_400_stip_data[:, 5]  # 6th column (index 5)
-        col8_80 = top_400_stip_data[:, 7:79]  # 8th to 80th columns (indices 7 to 79)
-        col81_171 = top_400_stip_data[:, 79:170]  # 81st to 171st columns (indices 80 to 170)
+from stip_reader import read_stip_file, StipData, PAIRS, CONFIDENCE_COLUMN, HOG_SIZE
+from codebook import N_CLUSTERS
 
-        # Create DataFrame
-        df = pd.DataFrame({
-            'sigma2': col5,
-            'tau2': col6,
-            'hog': list(col8_80),
-            'hof': list(col81_171)
-        })
+# Trains the HoG and HoF codebooks (40 centers per (sigma, tau) pair) on the
+# non-target STIPs. Files are streamed through a worker pool and only a bounded
+# reservoir sample per pair is kept, so memory does not grow with the dataset.
 
-        return df
+TOP_PER_FILE = 400  # Most confident STIPs kept per file
+SAMPLE_SIZE = 10000  # STIPs sampled per (sigma, tau) pair
 
-    except IndexError as idx_error:
-        print(f"IndexError processing {file_path}: {idx_error}")
-        return None
+def read_top_stips(file_path, cache=False):
+    """Read a STIP file and keep its TOP_PER_FILE most confident rows as a StipData, or return None if it cannot be read."""
+    try:
+        stip_data = read_stip_file(file_path, cache)
     except Exception as e:
-        # Catch any other errors and print the file causing the issue
         print(f"Error processing {file_path}: {e}")
         return None
 
-def process_file(file_path):
-    """Process a single file and return a DataFrame."""
-    df = read_stip_file_to_dataframe(file_path)
-    return df
-
-def flatten_features(features):
-    """Flatten the feature arrays into a 2D numpy array."""
-    return np.vstack(features)
-
-def apply_kmeans(df, k=40):
-    """Apply K-means clustering to HoG and HoF features."""
-    hog_features = df['hog'].values
-    hof_features = df['hof'].values
-
-    hog_2d = flatten_features(hog_features)
-    hof_2d = flatten_features(hof_features)
-    
-    kmeans_hog = KMeans(n_clusters=k, random_state=1).fit(hog_2d)
-    kmeans_hof = KMeans(n_clusters=k, random_state=1).fit(hof_2d)
-    
-    return kmeans_hog, kmeans_hof
-
-def process_folder(folder_path):
-    """Process all files in a folder and return combined DataFrames."""
-    # Get a list of all text files in the folder
-    files = glob.glob(os.path.join(folder_path, "*.txt"))
-
-    all_stips = []
-
-    # Process files in parallel
-    with ProcessPoolExecutor() as executor:
-        futures = [executor.submit(process_file, file) for file in files]
+    if stip_data.size == 0:
+        print(f"File is empty: {file_path}")
+        return None
+
+    # Sort in descending order of detector confidence
+    return StipData.from_array(stip_data[stip_data[:, CONFIDENCE_COLUMN].argsort()[::-1]][:TOP_PER_FILE])
+
+def process_chunk(files, cache=False):
+    """Read a chunk of STIP files and return {(sigma, tau): HoG + HoF descriptor rows} of their top STIPs."""
+    groups = {}
+    for file in files:
+        stip = read_top_stips(file, cache)
+        if stip is None:
+            continue
+
+        for pair in stip.pairs():
+            hog, hof, _ = stip.pair_rows(pair)
+            groups.setdefault(pair, []).append(np.hstack([hog, hof]))
+
+    return {pair: np.concatenate(rows) for pair, rows in groups.items()}
+
+class ReservoirSample:
+    """Uniform sample of at most capacity rows from a stream of row batches (Algorithm R)."""
+
+    def __init__(self, capacity, seed=1):
+        self.capacity = capacity
+        self.rng = np.random.default_rng(seed)
+        self.rows = None
+        self.seen = 0
+
+    def add(self, rows):
+        if self.rows is None:
+            self.rows = np.empty((self.capacity, rows.shape[1]), dtype=rows.dtype)
+
+        # Fill the reservoir first
+        fill = min(len(rows), self.capacity - min(self.seen, self.capacity))
+        if fill > 0:
+            self.rows[self.seen:self.seen + fill] = rows[:fill]
+
+        # Row i of the stream replaces a random slot with probability capacity / (i + 1)
+        rest = rows[fill:]
+        if len(rest):
+            positions = np.arange(self.seen + fill, self.seen + len(rows))
+            slots = self.rng.integers(0, positions + 1)
+            replace = np.flatnonzero(slots < self.capacity)
+
+            # When a slot is hit more than once in the batch, the last row wins
+            last_slots, last_rows = np.unique(slots[replace][::-1], return_index=True)
+            self.rows[last_slots] = rest[replace[::-1][last_rows]]
+
+        self.seen += len(rows)
+
+    @property
+    def sample(self):
+        return self.rows[:min(self.seen, self.capacity)]
+
+def train_centers(features, k=N_CLUSTERS, minibatch=False, num_threads=1):
+    """Fit k-means (or mini-batch k-means) to the features and return the cluster centers."""
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    from threadpoolctl import threadpool_limits
+
+    # Several models train at once, so each one gets only its share of the cores
+    with threadpool_limits(num_threads):
+        if minibatch:
+            model = MiniBatchKMeans(n_clusters=k, random_state=1, batch_size=1024)
+        else:
+            model = KMeans(n_clusters=k, random_state=1)
+        return model.fit(features).cluster_centers_
+
+def centers_dataframe(sigma, tau, centers):
+    """Prefix cluster centers with the folder_name, sigma and tau metadata columns."""
+    metadata = pd.DataFrame([{'folder_name': 'combined', 'sigma': sigma, 'tau': tau}] * len(centers))
+    return pd.concat([metadata, pd.DataFrame(centers)], axis=1)
+
+def sample_stips(files, sample_size=SAMPLE_SIZE, num_workers=None, chunk_size=32, cache=False):
+    """Stream every STIP file through a worker pool into one reservoir sample per (sigma, tau) pair."""
+    reservoirs = {pair: ReservoirSample(sample_size) for pair in PAIRS}
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(process_chunk, chunk, cache) for chunk in chunks]
         for future in as_completed(futures):
-            result = future.result()
-            if result is not None:
-                all_stips.append(result)
+            for pair, rows in future.result().items():
+                reservoirs[pair].add(rows)
+            done += 1
+            print(f"{done}/{len(chunks)} chunks read")
 
-    # Concatenate all DataFrames (each with 400 STIPs)
-    combined_df = pd.concat(all_stips, ignore_index=True)
+    return {pair: reservoir.sample for pair, reservoir in reservoirs.items() if reservoir.seen > 0}
 
-    return combined_df
+def train_codebooks(samples, num_workers=None, minibatch=False):
+    """Train the HoG and HoF k-means of every pair in parallel; returns {(pair, 'hog' | 'hof'): centers}."""
+    num_workers = num_workers or os.cpu_count()
+    num_threads = max(1, os.cpu_count() // num_workers)
+    centers = {}
+
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {}
+        for pair, sample in samples.items():
+            futures[executor.submit(train_centers, sample[:, :HOG_SIZE], N_CLUSTERS, minibatch, num_threads)] = (pair, 'hog')
+            futures[executor.submit(train_centers, sample[:, HOG_SIZE:], N_CLUSTERS, minibatch, num_threads)] = (pair, 'hof')
+
+        for future in as_completed(futures):
+            centers[futures[future]] = future.result()
+            print(f"Trained {len(centers)}/{len(futures)} codebooks")
+
+    return centers
 
 def main():
+    parser = argparse.ArgumentParser(description="Train the HoG/HoF codebooks on the non-target STIP files.")
     # Directory path for the video folders
-    base_dir = "./hmdb51_org_stips/non_target_videos/"
-    
-    # Get a list of all subdirectories in the base directory
-    folders = [f for f in glob.glob(os.path.join(base_dir, '*')) if os.path.isdir(f)]
-    
-    # Create a directory to save the results
-    output_dir = "kmeans_results"
-    os.makedirs(output_dir, exist_ok=True)
-    
-    # Define sigma and tau values
-    sigmas = [4, 8, 16, 32, 64, 128]
-    taus = [2, 4]
-    
-    # Lists to accumulate results for all folders
-    all_hog_clusters = []
-    all_hof_clusters = []
-    
-    # Process each folder in parallel
-    all_stips_df = pd.DataFrame()
-    
-    with ProcessPoolExecutor() as executor:
-        folder_futures = {executor.submit(process_folder, folder): folder for folder in folders}
-        for future in as_completed(folder_futures):
-            folder_df = future.result()
-            if folder_df is not None:
-                all_stips_df = pd.concat([all_stips_df, folder_df], ignore_index=True)
-
-    # For each sigma-tau pair, filter and sample 10,000, then apply KMeans
-    for sigma in sigmas:
-        for tau in taus:
-            # Filter for current sigma and tau
-            filtered_df = all_stips_df[(all_stips_df['sigma2'] == sigma) & (all_stips_df['tau2'] == tau)]
-            
-            if not filtered_df.empty:
-                # Sample 10,000 rows (or all rows if fewer than 10,000)
-                sample_size = min(10000, filtered_df.shape[0])
-                sampled_df = filtered_df.sample(n=sample_size, random_state=1)
-                
-                # Apply KMeans clustering to the sampled DataFrame
-                kmeans_hog, kmeans_hof = apply_kmeans(sampled_df, k=40)
-                
-                # Get cluster centers for HoG and HoF
-                hog_cluster_centers = kmeans_hog.cluster_centers_
-                hof_cluster_centers = kmeans_hof.cluster_centers_
-                
-                # Add metadata
-                metadata = {
-                    'folder_name': 'combined',
-                    'sigma': sigma,
-                    'tau': tau
-                }
-                
-                # Create DataFrames for HoG and HoF
-                hog_df = pd.DataFrame(hog_cluster_centers)
-                hog_df = pd.concat([pd.DataFrame([metadata] * hog_df.shape[0]), hog_df], axis=1)
-                
-                hof_df = pd.DataFrame(hof_cluster_centers)
-                hof_df = pd.concat([pd.DataFrame([metadata] * hof_df.shape[0]), hof_df], axis=1)
-                
-                # Append to lists
-                all_hog_clusters.append(hog_df)
-                all_hof_clusters.append(hof_df)
-
-    # Concatenate all cluster center DataFrames
-    hog_combined_df = pd.concat(all_hog_clusters, ignore_index=True)
-    hof_combined_df = pd.concat(all_hof_clusters, ignore_index=True)
-    
+    parser.add_argument("base_dir", nargs="?", default="./hmdb51_org_stips/non_target_videos/")
+    # Directory to save the results
+    parser.add_argument("--output-dir", default="kmeans_results")
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE, help="STIPs sampled per (sigma, tau) pair")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=32, help="STIP files per read task")
+    parser.add_argument("--minibatch", action="store_true", help="Use mini-batch k-means")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    files = glob.glob(os.path.join(args.base_dir, '*', '*.txt'))
+    print(f"Sampling STIPs from {len(files)} files")
+
+    samples = sample_stips(files, args.sample_size, args.workers, args.chunk_size)
+    centers = train_codebooks(samples, args.workers, args.minibatch)
+
+    # Center files are laid out pair by pair, sigma first
+    pairs = [pair for pair in PAIRS if pair in samples]
+    hog_combined_df = pd.concat([centers_dataframe(sigma, tau, centers[((sigma, tau), 'hog')]) for sigma, tau in pairs], ignore_index=True)
+    hof_combined_df = pd.concat([centers_dataframe(sigma, tau, centers[((sigma, tau), 'hof')]) for sigma, tau in pairs], ignore_index=True)
+
     # Save to separate CSV files
-    hog_combined_df.to_csv(os.path.join(output_dir, 'combined_hog_cluster_centers.csv'), index=False)
-    hof_combined_df.to_csv(os.path.join(output_dir, 'combined_hof_cluster_centers.csv'), index=False)
+    hog_combined_df.to_csv(os.path.join(args.output_dir, 'combined_hog_cluster_centers.csv'), index=False)
+    hof_combined_df.to_csv(os.path.join(args.output_dir, 'combined_hof_cluster_centers.csv'), index=False)
 
     print("Combined cluster centers for HoG and HoF have been saved to 'combined_hog_cluster_centers.csv' and 'combined_hof_cluster_centers.csv'.")
 
@@ -1,10 +1,17 @@
 import os
+import sys
+import time
 import glob
+import argparse
+from functools import partial
 import pandas as pd
 from concurrent.futures import ProcessPoolExecutor
 from get_features import process_file
 
-def process_folder(target_folder, output_csv, num_workers=4):
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from profiling import profiler, call_profiled
+
+def process_folder(target_folder, output_csv, num_workers=4, cache=True):
     # Recursively find all .txt files in the target folder and its subdirectories
     video_files = glob.glob(os.path.join(target_folder, '**', '*.txt'), recursive=True)
 
@@ -13,11 +20,12 @@ def process_folder(target_folder, output_csv, num_workers=4):
 
     # Use ProcessPoolExecutor to process files in parallel
     with ProcessPoolExecutor(max_workers=num_workers) as executor:
-        # Map the process_file function to all video files
-        results = executor.map(process_file, video_files)
+        # Map the process_file function to all video files, caching parsed STIP files for reruns
+        results = executor.map(partial(call_profiled, process_file, cache=cache), video_files)
 
-        # Iterate over the results and append valid DataFrames to the list
-        for result in results:
+        # Iterate over the results and append valid DataFrames to the list, merging the worker timings
+        for result, snapshot in results:
+            profiler.merge(snapshot)
             if result is not None:
                 all_histogram_data.append(result)
 
@@ -34,5 +42,13 @@ if __name__ == '__main__':
     target_folder = '../hmdb51_org_stips/target_videos'
     output_csv = '../task4/processed_histograms.csv'
 
+    parser = argparse.ArgumentParser(description="Build the BOF-960 histograms of all target videos.")
+    parser.add_argument("--profile", nargs="?", const="build_profile.json", help="Write a JSON timing breakdown of the build")
+    args = parser.parse_args()
+
     # Process all videos in the folder and its subfolders using 10 parallel workers
-    process_folder(target_folder, output_csv, num_workers=10)
\ No newline at end of file
+    start = time.perf_counter()
+    process_folder(target_folder, output_csv, num_workers=10)
+
+    if args.profile:
+        profiler.write_json(args.profile, build="BOF-960", wall_seconds=time.perf_counter() - start)
\ No newline at end of file
@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+from video_histograms import BIN_CENTERS
+
+# Earth Mover's Distance between COL-HIST histograms. A histogram is 48 cells (3 key
+# frames x 4 x 4 grid), each a 12-bin Lab colour histogram; every cell is normalised
+# to a distribution and moved with the Euclidean distance between the Lab bin centers
+# as ground distance. The distance between two videos is the sum over their cells.
+
+N_BINS = len(BIN_CENTERS)
+GROUND_DISTANCE = np.linalg.norm(BIN_CENTERS[:, None] - BIN_CENTERS[None], axis=2)  # (12, 12)
+GROUND_DISTANCE_32 = GROUND_DISTANCE.astype(np.float32)
+
+# Cost of a cell that is empty in only one of the two histograms (all its mass has to go)
+EMPTY_CELL_COST = GROUND_DISTANCE.max()
+
+SINKHORN_EPSILON = 4.0  # Entropic regularisation in Lab units
+SINKHORN_ITERATIONS = 25
+
+# Upper bound on the corpus cells handled at once
+MAX_BLOCK_CELLS = 2 ** 19
+
+def cell_distributions(histograms, dtype=np.float64):
+    """Split (videos, 576) histograms into (videos, cells, 12) distributions and a (videos, cells) non-empty mask."""
+    cells = np.asarray(histograms, dtype=dtype).reshape(len(histograms), -1, N_BINS)
+    mass = cells.sum(axis=2, keepdims=True)
+    distributions = np.divide(cells, mass, out=np.zeros_like(cells), where=mass > 0)
+    return distributions, mass[..., 0] > 0
+
+def _empty_cell_costs(query_mask, corpus_mask):
+    """Per-cell cost where either side is empty: 0 when both are, EMPTY_CELL_COST when one is."""
+    return np.where(query_mask[None, :] != corpus_mask, EMPTY_CELL_COST, 0.0)
+
+def _corpus_blocks(num_rows, num_cells):
+    rows_per_block = max(1, MAX_BLOCK_CELLS // num_cells)
+    for start in range(0, num_rows, rows_per_block):
+        yield start, min(start + rows_per_block, num_rows)
+
+def cell_emd(p, q):
+    """Exact EMD between two 12-bin distributions with the Lab ground distance."""
+    distance, _, _ = cv2.EMD(p.astype(np.float32)[:, None], q.astype(np.float32)[:, None],
+                             cv2.DIST_USER, cost=GROUND_DISTANCE_32)
+    return distance
+
+def emd_distance(hist1, hist2):
+    """Exact EMD between two COL-HIST histograms: the sum of the per-cell EMDs."""
+    (p, q), (p_mask, q_mask) = cell_distributions(np.vstack([np.ravel(hist1), np.ravel(hist2)]))
+
+    total = 0.0
+    for cell in range(len(p)):
+        if p_mask[cell] and q_mask[cell]:
+            total += cell_emd(p[cell], q[cell])
+        elif p_mask[cell] != q_mask[cell]:
+            total += EMPTY_CELL_COST
+    return total
+
+def centroid_lower_bounds(query, corpus):
+    """
+    Lower bound on the EMD of a query against every corpus histogram.
+
+    With a Euclidean ground distance the EMD of a cell is at least the distance between
+    the Lab centroids of its two distributions, so the bound is a sum of centroid gaps.
+    """
+    query_cells, query_mask = cell_distributions([query])
+    query_centroids = query_cells[0] @ BIN_CENTERS
+    bounds = np.empty(len(corpus))
+
+    for start, end in _corpus_blocks(len(corpus), len(query_mask[0])):
+        cells, mask = cell_distributions(corpus[start:end])
+        gaps = np.linalg.norm(cells @ BIN_CENTERS - query_centroids[None], axis=2)
+        both = mask & query_mask
+        bounds[start:end] = np.where(both, gaps, _empty_cell_costs(query_mask[0], mask)).sum(axis=1)
+
+    return bounds
+
+def emd_top_k(query, corpus, k, block_size=64):
+    """
+    Exact top k by EMD: (indices, distances) in ascending order.
+
+    Corpus rows are visited in order of their centroid lower bound and refined with
+    exact per-cell EMDs; the search stops once the k-th best exact distance is no
+    larger than the lower bound of every row not yet refined.
+    """
+    k = min(k, len(corpus))
+    if k <= 0:
+        return np.array([], dtype=int), np.array([])
+
+    bounds = centroid_lower_bounds(query, corpus)
+    order = np.argsort(bounds, kind='stable')
+
+    best_indices = np.empty(0, dtype=int)
+    best_distances = np.empty(0)
+
+    for start in range(0, len(order), block_size):
+        candidates = order[start:start + block_size]
+        if len(best_distances) == k and bounds[candidates[0]] >= best_distances[-1]:
+            break
+
+        exact = np.array([emd_distance(query, corpus[i]) for i in candidates])
+        best_indices = np.concatenate([best_indices, candidates])
+        best_distances = np.concatenate([best_distances, exact])
+
+        keep = np.argsort(best_distances, kind='stable')[:k]
+        best_indices = best_indices[keep]
+        best_distances = best_distances[keep]
+
+    return best_indices, best_distances
+
+def batch_emd(queries, corpus):
+    """
+    Exact EMD of every query against every corpus histogram, for checking emd_top_k.
+
+    Not vectorised: a Python loop with one cv2.EMD call per non-empty cell pair (up to
+    48 per corpus row), so it is only practical for small corpora.
+    """
+    queries = np.atleast_2d(queries)
+    return np.array([[emd_distance(query, row) for row in corpus] for query in queries])
+
+def batch_sinkhorn_emd(queries, corpus, epsilon=SINKHORN_EPSILON, n_iter=SINKHORN_ITERATIONS):
+    """
+    Approximate EMD of every query against every corpus histogram with entropic
+    regularisation (Sinkhorn iterations), run for all cells of a corpus block at once.
+
+    Smaller epsilon is closer to the exact EMD but needs more iterations.
+    """
+    queries = np.atleast_2d(queries)
+    kernel = np.exp(-GROUND_DISTANCE / epsilon).astype(np.float32)
+    kernel_cost = (kernel * GROUND_DISTANCE).astype(np.float32)
+    distances = np.empty((len(queries), len(corpus)))
+
+    query_cells, query_masks = cell_distributions(queries, np.float32)
+    num_cells = query_cells.shape[1]
+
+    for start, end in _corpus_blocks(len(corpus), num_cells):
+        cells, mask = cell_distributions(corpus[start:end], np.float32)
+        # Empty cells get a uniform stand-in so the scaling stays finite; their cost is replaced below
+        cells[~mask] = 1.0 / N_BINS
+
+        for q, (query, query_mask) in enumerate(zip(query_cells, query_masks)):
+            query = query.copy()
+            query[~query_mask] = 1.0 / N_BINS
+
+            v = np.ones_like(cells)
+            for _ in range(n_iter):
+                u = query[None] / (v @ kernel.T)
+                v = cells / (u @ kernel)
+
+            cell_costs = (u * (v @ kernel_cost.T)).sum(axis=2)
+            both = mask & query_mask
+            distances[q, start:end] = np.where(both, cell_costs, _empty_cell_costs(query_mask, mask)).sum(axis=1)
+
+    return distances
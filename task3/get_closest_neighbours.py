@@ -1,15 +1,20 @@
-import cv2
 import numpy as np
 import os
-import csv
-from scipy.spatial.distance import cdist
-from scipy.optimize import linear_sum_assignment
+import sys
 from video_histograms import extract_histograms_from_frames
+from emd import emd_distance, emd_top_k, batch_sinkhorn_emd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from feature_store import load_features, store_version
+from profiling import profiler
 
 # Define constants for grid size and number of bins
 R = 4  # Grid size
 N_BINS = 12  # Number of histogram bins
 
+# Square-rooted corpus matrices for the Bhattacharyya distance, {csv path: (store version, matrix)}
+_corpus_sqrts = {}
+
 # Define the bin centers for EMD calculation
 BIN_CENTERS = np.array([
     [25, -40, -40], [25, 40, 40], [50, 0, 0], [50, -40, 40],
@@ -18,21 +23,8 @@ BIN_CENTERS = np.array([
 ])
 
 def compute_emd(hist1, hist2):
-    """Compute Earth Mover's Distance (EMD) between two histograms."""
-    # Reshape histograms to match the number of bin centers
-    hist1 = hist1.reshape(-1, 3)
-    hist2 = hist2.reshape(-1, 3)
-
-    # Compute distance matrix
-    distance_matrix = cdist(hist1, hist2, metric='euclidean')
-
-    # Solve the assignment problem
-    row_ind, col_ind = linear_sum_assignment(distance_matrix)
-
-    # Compute the total cost
-    emd = distance_matrix[row_ind, col_ind].sum()
-    
-    return emd
+    """Compute Earth Mover's Distance (EMD) between two histograms, cell by cell over the Lab bin centers."""
+    return emd_distance(hist1, hist2)
 
 def compute_histogram_intersection(hist1, hist2):
     """Compute histogram intersection distance between two histograms."""
@@ -58,42 +50,143 @@ def compute_bhattacharyya_distance(hist1, hist2):
     # Return the distance
     return -np.log(bc + 1e-10)  # Add a small constant to avoid log(0)
 
-def process_video_COL_HIST(video_path, csv_file_path, distance_function="emd", top_k=10):
-    """Process a single video, compute its histogram, and return the top_k closest videos based on the selected distance function."""
+def compute_chi_squared_distance(hist1, hist2):
+    """Compute the symmetric chi-squared distance between two histograms."""
+    hist1 = hist1.reshape(-1).astype(float)
+    hist2 = hist2.reshape(-1).astype(float)
+
+    total = hist1 + hist2
+    nonzero = total > 0
+
+    return 0.5 * np.sum((hist1[nonzero] - hist2[nonzero]) ** 2 / total[nonzero])
+
+# Upper bound on the elements of the (queries, corpus rows, bins) temporaries built by the batch kernels
+MAX_BLOCK_ELEMENTS = 2 ** 22
+
+def _corpus_blocks(queries, corpus):
+    """Yield (start, end) corpus row ranges that keep broadcasting temporaries bounded."""
+    rows_per_block = max(1, MAX_BLOCK_ELEMENTS // (queries.shape[0] * queries.shape[1]))
+    for start in range(0, corpus.shape[0], rows_per_block):
+        yield start, min(start + rows_per_block, corpus.shape[0])
+
+def batch_histogram_intersection(queries, corpus):
+    """Histogram intersection distance (1 - sum(min)) of every query against every corpus histogram."""
+    queries = np.atleast_2d(queries).astype(float)
+    distances = np.empty((queries.shape[0], corpus.shape[0]))
+
+    for start, end in _corpus_blocks(queries, corpus):
+        block = np.asarray(corpus[start:end], dtype=float)
+        distances[:, start:end] = 1 - np.minimum(queries[:, None, :], block[None, :, :]).sum(axis=2)
+
+    return distances
+
+def batch_bhattacharyya_distance(queries, corpus, corpus_sqrt=None):
+    """
+    Bhattacharyya distance of every query against every corpus histogram.
+
+    The coefficients are one matmul of square-root histograms; pass corpus_sqrt to
+    reuse precomputed np.sqrt(corpus) across queries.
+    """
+    queries = np.atleast_2d(queries).astype(float)
+    if corpus_sqrt is None:
+        corpus_sqrt = np.sqrt(np.asarray(corpus, dtype=float))
+
+    bc = np.sqrt(queries) @ corpus_sqrt.T
+
+    return -np.log(bc + 1e-10)  # Add a small constant to avoid log(0)
+
+def batch_chi_squared_distance(queries, corpus):
+    """Symmetric chi-squared distance of every query against every corpus histogram."""
+    queries = np.atleast_2d(queries).astype(float)
+    distances = np.empty((queries.shape[0], corpus.shape[0]))
+
+    for start, end in _corpus_blocks(queries, corpus):
+        block = np.asarray(corpus[start:end], dtype=float)
+        total = queries[:, None, :] + block[None, :, :]
+        diff_sq = (queries[:, None, :] - block[None, :, :]) ** 2
+        distances[:, start:end] = 0.5 * np.divide(diff_sq, total, out=np.zeros_like(total), where=total > 0).sum(axis=2)
+
+    return distances
+
+BATCH_DISTANCE_FUNCTIONS = {
+    'intersection': batch_histogram_intersection,
+    'bhattacharyya': batch_bhattacharyya_distance,
+    'chi_squared': batch_chi_squared_distance,
+    'emd_sinkhorn': batch_sinkhorn_emd,
+}
+
+# Exact EMD is not scored block by block: col_hist_top_k prunes the corpus with emd_top_k
+DISTANCE_FUNCTIONS = [*BATCH_DISTANCE_FUNCTIONS, 'emd']
+
+def load_corpus_sqrt(csv_file_path):
+    """np.sqrt of a corpus matrix for the Bhattacharyya distance, computed once per version of its store."""
+    load_features(csv_file_path)  # Converts a stale store first, so the version below is current
+    key = os.path.abspath(csv_file_path)
+    version = store_version(csv_file_path)
+
+    if key not in _corpus_sqrts or _corpus_sqrts[key][0] != version:
+        _, _, corpus = load_features(csv_file_path)
+        _corpus_sqrts[key] = (version, np.sqrt(np.asarray(corpus, dtype=float)))
+    return _corpus_sqrts[key][1]
+
+@profiler.timed("distance")
+def compute_distances(queries, corpus, distance_function, corpus_sqrt=None):
+    """
+    Score a query (or a block of queries) against the whole corpus matrix; returns (n_queries, n_corpus).
+
+    corpus_sqrt (see load_corpus_sqrt) is used by the Bhattacharyya distance instead of
+    square-rooting the corpus for every query.
+    """
+    profiler.count("rows_scored", len(np.atleast_2d(queries)) * len(corpus))
+    if distance_function == 'emd':
+        raise ValueError("Exact EMD is only searched for the top k, use col_hist_top_k.")
+    if distance_function not in BATCH_DISTANCE_FUNCTIONS:
+        raise ValueError(f"Distance function '{distance_function}' is not recognized.")
+    if distance_function == 'bhattacharyya':
+        return batch_bhattacharyya_distance(queries, corpus, corpus_sqrt)
+    return BATCH_DISTANCE_FUNCTIONS[distance_function](queries, corpus)
+
+def top_k_indices(distances, k):
+    """Return the indices of the k smallest distances in ascending order."""
+    k = min(k, len(distances))
+    if k <= 0:
+        return np.array([], dtype=int)
+
+    # Partition first so only k elements need a full sort
+    candidates = np.argpartition(distances, k - 1)[:k]
+    return candidates[np.argsort(distances[candidates], kind='stable')]
+
+def col_hist_top_k(histogram, corpus, distance_function, k, corpus_sqrt=None):
+    """(indices, distances) of the k corpus histograms closest to a query histogram, in ascending order."""
+    if distance_function == "emd":
+        # Exact EMD only refines the rows its lower bound cannot rule out
+        with profiler.timer("distance"):
+            return emd_top_k(histogram, corpus, k)
+
+    distances = compute_distances(histogram, corpus, distance_function, corpus_sqrt)[0]
+    indices = top_k_indices(distances, k)
+    return indices, distances[indices]
+
+def process_video_COL_HIST(video_path, csv_file_path, distance_function="emd", top_k=10, histogram=None):
+    """
+    Process a single video, compute its histogram, and return the top_k closest videos based on the selected distance function.
+
+    histogram can be passed in (e.g. from already decoded key frames) to skip reading the video.
+    """
     # Extract histogram from the video
-    histogram = extract_histograms_from_frames(video_path, R, N_BINS)
+    if histogram is None:
+        histogram = extract_histograms_from_frames(video_path, R, N_BINS)
     
     if histogram is None:
         raise ValueError("No histogram available for the video")
 
-    # Read existing histograms from CSV
-    existing_histograms = []
-    file_names = []
-    with open(csv_file_path, mode='r') as file:
-        reader = csv.reader(file)
-        header = next(reader)  # Skip header
-        for row in reader:
-            file_names.append(row[0])
-            existing_histograms.append(np.array(row[2:], dtype=np.float32))
+    # Read existing histograms from the feature store of the CSV file
+    file_names, _, existing_histograms = load_features(csv_file_path)
+    corpus_sqrt = load_corpus_sqrt(csv_file_path) if distance_function == "bhattacharyya" else None
     
-    # Compare the computed histogram with each existing histogram using the selected distance function
-    distance_results = []
-    for existing_hist in existing_histograms:
-        if distance_function == 'emd':
-            distance = compute_emd(histogram, existing_hist)
-        elif distance_function == 'intersection':
-            distance = compute_histogram_intersection(histogram, existing_hist)
-        elif distance_function == 'bhattacharyya':
-            distance = compute_bhattacharyya_distance(histogram, existing_hist)
-        else:
-            raise ValueError(f"Distance function '{distance_function}' is not recognized.")
-        distance_results.append(distance)
-
-    # Sort distance results and get the top_k closest videos
-    sorted_indices = np.argsort(distance_results)[:top_k]
-    closest_files = [(file_names[i], distance_results[i]) for i in sorted_indices]
-
-    return closest_files
+    # Compare the computed histogram with the existing histograms and keep the top_k closest videos
+    sorted_indices, distances = col_hist_top_k(histogram, existing_histograms, distance_function, top_k, corpus_sqrt)
+    return [(file_names[i], distance) for i, distance in zip(sorted_indices, distances)]
 
 if __name__ == "__main__":
     import sys
@@ -2,13 +2,20 @@ import cv2
 import numpy as np
 import os
 import csv
+import sys
+import time
 import glob
-from concurrent.futures import ProcessPoolExecutor
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from video_histograms import extract_histograms_from_frames  # Import from your existing code
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from manifest import prepare_incremental_build
+from profiling import profiler, call_profiled
+
 def process_video(video_path, r, n_bins):
     """Process a single video and return concatenated histogram along with file name and path."""
-    histogram = extract_histograms_from_frames(video_path, r, n_bins)
+    histogram = extract_histograms_from_frames(video_path, r, n_bins, use_feature_cache=False)
     file_name = os.path.basename(video_path)
 
     if histogram is not None:
@@ -30,25 +37,54 @@ def save_to_csv(results, csv_file_path):
         # Write results
         writer.writerows(results)
 
-def process_folder(target_folder, r, n_bins, csv_file_path):
-    """Process all videos in the target folder and save histograms to a CSV file."""
-    all_results = []
-    
-    # Use glob to find all subfolders
-    subfolders = glob.glob(os.path.join(target_folder, '*'))
-    
-    for subfolder in subfolders:
-        # Use glob to find all video files in each subfolder
-        video_files = glob.glob(os.path.join(subfolder, '*.avi')) + glob.glob(os.path.join(subfolder, '*.mp4'))
-        
-        with ProcessPoolExecutor() as executor:
-            futures = [executor.submit(process_video, video_path, r, n_bins) for video_path in video_files]
-            
-            for future in futures:
-                all_results.extend(future.result())
-
-    # Save all results to CSV
-    save_to_csv(all_results, csv_file_path)
+def manifest_path(csv_file_path):
+    """Return the path of the manifest kept next to an output CSV file."""
+    return os.path.splitext(csv_file_path)[0] + ".manifest.json"
+
+def process_folder(target_folder, r, n_bins, csv_file_path, chunk_size=64):
+    """
+    Process the new or changed videos in the target folder and save histograms to a CSV file.
+
+    Results are committed every chunk_size videos, so an interrupted run resumes
+    after the last committed chunk.
+    """
+    # Use glob to find all video files in each subfolder
+    video_files = []
+    for subfolder in glob.glob(os.path.join(target_folder, '*')):
+        video_files.extend(glob.glob(os.path.join(subfolder, '*.avi')) + glob.glob(os.path.join(subfolder, '*.mp4')))
+
+    manifest, pending = prepare_incremental_build(manifest_path(csv_file_path), video_files, [csv_file_path])
+    if not pending:
+        return
+
+    results = []
+    done = []
+
+    def commit():
+        if results:
+            save_to_csv(results, csv_file_path)
+        manifest.record(done)
+        manifest.save()
+        results.clear()
+        done.clear()
+
+    with ProcessPoolExecutor() as executor:
+        futures = {executor.submit(call_profiled, process_video, video_path, r, n_bins): video_path for video_path in pending}
+
+        for future in as_completed(futures):
+            rows, snapshot = future.result()
+            profiler.merge(snapshot)
+            # Videos without a histogram stay out of the manifest and are retried on the next run
+            if not rows:
+                continue
+
+            results.extend(rows)
+            done.append(futures[future])
+
+            if len(done) >= chunk_size:
+                commit()
+
+    commit()
 
 if __name__ == "__main__":
     # Parameters
@@ -57,5 +93,13 @@ if __name__ == "__main__":
     n_bins = 12  # Number of histogram bins
     csv_file_path = './histograms.csv'  # Path to the CSV file to save results
 
+    parser = argparse.ArgumentParser(description="Build the COL-HIST histograms of all target videos.")
+    parser.add_argument("--profile", nargs="?", const="build_profile.json", help="Write a JSON timing breakdown of the build")
+    args = parser.parse_args()
+
     # Process the folder and save results
-    process_folder(target_folder, r, n_bins, csv_file_path)
\ No newline at end of file
+    start = time.perf_counter()
+    process_folder(target_folder, r, n_bins, csv_file_path)
+
+    if args.profile:
+        profiler.write_json(args.profile, build="COL-HIST", wall_seconds=time.perf_counter() - start)
\ No newline at end of file
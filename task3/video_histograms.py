@@ -1,7 +1,22 @@
 import cv2
 import numpy as np
 import os
-from scipy.spatial.distance import cdist
+import sys
+from functools import lru_cache
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'task4')))
+from profiling import profiler
+from feature_cache import feature_cache
+
+# Define 12 LAB bin centers
+BIN_CENTERS = np.array([
+    [25, -40, -40], [25, 40, 40], [50, 0, 0], [50, -40, 40],
+    [50, 40, -40], [75, 0, 60], [75, -60, 0], [75, 60, 0],
+    [75, 0, -60], [90, 0, 80], [90, -80, 0], [90, 80, 0]
+])
+
+# Lookup table from 8-bit Lab colour to bin index, built once and kept next to this module
+LAB_BIN_LUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lab_bin_lut.npy')
 
 def get_total_frames(video_path):
     """Manually count the total number of frames in the video."""
@@ -15,82 +30,237 @@ def get_total_frames(video_path):
     cap.release()
     return total_frames
 
-def get_key_frames(video_path):
-    """Extract the first, middle, and last frames from a video."""
-    total_frames = get_total_frames(video_path)  # Get the correct total frame count
+def frame_positions(total_frames, num_frames):
+    """Evenly spaced frame positions from first to last; num_frames=3 gives first, middle and last."""
+    if num_frames == 1:
+        return [0]
+    interior = [total_frames * i // (num_frames - 1) for i in range(1, num_frames - 1)]
+    return [0] + interior + [total_frames - 1]
+
+class KeyFrameSampler:
+    """
+    Pick num_frames evenly spaced frames (first, ..., last) out of one decode pass with
+    bounded memory, whether or not the container frame count is right.
+
+    Frames within `window` of the positions implied by total_frames are kept, so the
+    picks are exact when the count is right or slightly off. Every stride-th frame is
+    kept too, the stride doubling whenever more than `capacity` are held; when the
+    count is further off (or missing) a target falls back to the nearest of those.
+    Frames past the reported end are retrieved one by one so the last frame is exact.
+
+    Feed it every decoded index; it only needs the frames for which wants() is true.
+    """
+
+    def __init__(self, total_frames, num_frames, window=4, capacity=32):
+        self.num_frames = num_frames
+        self.capacity = capacity
+        self.near_positions = set()
+        self.end = -1  # Frames after this index are past the reported end
+        self.stride = 1
+
+        if total_frames > 0:
+            self.near_positions = {position + offset for position in frame_positions(total_frames, num_frames)
+                                   for offset in range(-window, window + 1)}
+            self.end = total_frames - 1 + window
+            while total_frames // (self.stride * 2) >= capacity:
+                self.stride *= 2
+
+        self.near = {}
+        self.sampled = {}
+        self.last = None  # (index, frame) of the newest frame past the reported end
+
+    def wants(self, index):
+        return index in self.near_positions or index % self.stride == 0 or index > self.end
+
+    def add(self, index, frame):
+        if index in self.near_positions:
+            self.near[index] = frame
+        if index > self.end:
+            self.last = (index, frame)
+        if index % self.stride == 0:
+            self.sampled[index] = frame
+            if len(self.sampled) > self.capacity:
+                self.stride *= 2
+                self.sampled = {i: kept for i, kept in self.sampled.items() if i % self.stride == 0}
+
+    def frames(self, decoded):
+        """The frames at the evenly spaced positions of a video that had `decoded` frames."""
+        if decoded == 0:
+            return [None] * self.num_frames
 
+        kept = {**self.sampled, **self.near}
+        if self.last is not None:
+            kept[self.last[0]] = self.last[1]
+
+        frames = []
+        for position in frame_positions(decoded, self.num_frames):
+            if position not in kept:
+                profiler.count("key_frames_inexact")
+                position = min(kept, key=lambda index: abs(index - position))
+            frames.append(kept[position])
+        return frames
+
+def read_key_frames(cap, num_frames, total_frames=None):
+    """
+    Single pass over a video that grab()-s every frame and retrieve()-s only those the
+    KeyFrameSampler needs. total_frames defaults to the container frame count.
+    """
+    if total_frames is None:
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    sampler = KeyFrameSampler(total_frames, num_frames)
+    decoded = 0
+
+    while cap.grab():
+        if sampler.wants(decoded):
+            ret, frame = cap.retrieve()
+            sampler.add(decoded, frame if ret else None)
+        decoded += 1
+
+    profiler.count("frames_decoded", decoded)
+    return sampler.frames(decoded)
+
+@profiler.timed("key_frames")
+def get_evenly_spaced_frames(video_path, num_frames=3, trust_metadata=True):
+    """
+    Read num_frames evenly spaced frames (first, ..., last) from a video in one decode pass.
+
+    The container frame count, when trust_metadata is set, decides which frames are
+    kept; see KeyFrameSampler for how a wrong or missing count is handled.
+    """
     cap = cv2.VideoCapture(video_path)
-    
-    # Define frame positions (first, middle, and last)
-    frame_positions = [0, total_frames // 2, total_frames - 1]
-    key_frames = []
-
-    # Extract frames at the defined positions
-    for frame_pos in frame_positions:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_pos)
-        ret, frame = cap.read()
-        if ret:
-            key_frames.append(frame)
-        else:
-            key_frames.append(None)
-
-    # Release the video capture object
+    frames = read_key_frames(cap, num_frames, None if trust_metadata else 0)
+    cap.release()
+
+    if os.path.exists(video_path):
+        profiler.count("bytes_read", os.path.getsize(video_path))
+    return frames
+
+@profiler.timed("decode_video")
+def decode_video(video_path, num_frames, frame_size, num_key_frames=3):
+    """
+    Decode a video once for both frame consumers: returns the R3D18 clip (first
+    num_frames frames, resized to frame_size and RGB, padded with the last frame)
+    and the evenly spaced BGR key frames used by COL-HIST. The clip size is passed
+    in so this module does not import the R3D18 code.
+
+    Frames that neither needs are only grab()-ed; the key frames are picked by a
+    KeyFrameSampler, so a wrong container frame count does not need a second pass.
+    """
+    cap = cv2.VideoCapture(video_path)
+
+    assert cap.isOpened(), f"Failed to open video file {video_path}"
+
+    key_frames = KeyFrameSampler(int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), num_key_frames)
+    clip = np.empty((num_frames, frame_size, frame_size, 3), dtype=np.uint8)
+    count = 0
+    decoded = 0
+
+    while cap.grab():
+        in_clip = decoded < num_frames
+        is_key_frame = key_frames.wants(decoded)
+        if in_clip or is_key_frame:
+            ret, frame = cap.retrieve()
+            if ret and in_clip and count == decoded:
+                cv2.cvtColor(cv2.resize(frame, (frame_size, frame_size)), cv2.COLOR_BGR2RGB, dst=clip[count])
+                count += 1
+            if is_key_frame:
+                key_frames.add(decoded, frame if ret else None)
+        decoded += 1
+
     cap.release()
+    profiler.count("frames_decoded", decoded)
+    profiler.count("bytes_read", os.path.getsize(video_path))
+
+    assert count > 0, f"No frames decoded from video file {video_path}"
+
+    if count < num_frames:
+        clip[count:] = clip[count - 1]
+
+    return clip, key_frames.frames(decoded)
+
+def get_key_frames(video_path):
+    """Extract the first, middle, and last frames from a video."""
+    first_frame, middle_frame, last_frame = get_evenly_spaced_frames(video_path, 3)
 
     # Return the three frames (first, middle, last)
-    return key_frames[0], key_frames[1], key_frames[2]
+    return first_frame, middle_frame, last_frame
 
 def convert_rgb_to_lab(image):
     """Convert an RGB image to LAB color space."""
     return cv2.cvtColor(image, cv2.COLOR_BGR2Lab)
 
+def build_lab_bin_lut():
+    """Map every 8-bit Lab colour from cv2.cvtColor to the index of its nearest bin center."""
+    values = np.arange(256, dtype=np.int32)
+    centers = BIN_CENTERS.astype(np.int32)
+
+    # Squared distances split into the L part and the (a, b) part; exact in integers
+    l_distances = (values[:, None] - centers[None, :, 0]) ** 2
+    ab_distances = ((values[:, None, None] - centers[None, None, :, 1]) ** 2 +
+                    (values[None, :, None] - centers[None, None, :, 2]) ** 2)
+
+    lut = np.empty((256, 256, 256), dtype=np.uint8)
+    for l in range(256):
+        lut[l] = np.argmin(ab_distances + l_distances[l], axis=2)
+
+    return lut
+
+@lru_cache(maxsize=None)
+def get_lab_bin_lut():
+    """Load the Lab to bin lookup table, building and saving it on first use."""
+    if os.path.exists(LAB_BIN_LUT_PATH):
+        return np.load(LAB_BIN_LUT_PATH).reshape(-1)
+
+    lut = build_lab_bin_lut()
+
+    # Parallel build workers may build it at the same time; each writes its own
+    # temporary file and moves it into place, so no worker loads a half-written table
+    tmp_path = f"{LAB_BIN_LUT_PATH}.{os.getpid()}.tmp.npy"
+    try:
+        np.save(tmp_path, lut)
+        os.replace(tmp_path, LAB_BIN_LUT_PATH)
+    except OSError as e:
+        print(f"Could not save {LAB_BIN_LUT_PATH}: {e}")
+
+    return lut.reshape(-1)
+
+def quantize_lab_image(image):
+    """Convert a BGR image to Lab in one call and map every pixel to its bin index."""
+    lab = convert_rgb_to_lab(image)
+    flat_index = (lab[..., 0].astype(np.int32) << 16) | (lab[..., 1].astype(np.int32) << 8) | lab[..., 2]
+    return get_lab_bin_lut()[flat_index]
+
 def compute_lab_histogram_for_cell(cell, n_bins):
     """Compute the LAB histogram for a single cell using predefined bin centers."""
-    # Define 12 LAB bin centers
-    bin_centers = np.array([
-        [25, -40, -40], [25, 40, 40], [50, 0, 0], [50, -40, 40],
-        [50, 40, -40], [75, 0, 60], [75, -60, 0], [75, 60, 0],
-        [75, 0, -60], [90, 0, 80], [90, -80, 0], [90, 80, 0]
-    ])
-
-    lab_cell = convert_rgb_to_lab(cell)
-    h, w = lab_cell.shape[:2]
-    pixels = lab_cell.reshape(-1, 3)
-
-    # Compute distances from each pixel to each bin center
-    distances = cdist(pixels, bin_centers)
-    bin_indices = np.argmin(distances, axis=1)
-    
-    # Compute histogram counts
-    hist, _ = np.histogram(bin_indices, bins=np.arange(n_bins + 1))
-    
-    return hist
+    bin_indices = quantize_lab_image(cell)
+    return np.bincount(bin_indices.ravel(), minlength=n_bins)
+
+@lru_cache(maxsize=16)
+def get_cell_index_map(r, cell_h, cell_w):
+    """Return the (r * cell_h, r * cell_w) map of row-major cell indices."""
+    rows = np.repeat(np.arange(r), cell_h)
+    cols = np.repeat(np.arange(r), cell_w)
+    return rows[:, None] * r + cols[None, :]
 
+@profiler.timed("lab_quantize")
 def process_frame_in_cells(frame, r, n_bins):
     """Divide a frame into cells and compute LAB histograms for each cell."""
     height, width = frame.shape[:2]
     cell_h = height // r
     cell_w = width // r
-    histograms = []
-
-    for i in range(r):
-        for j in range(r):
-            y_start, y_end = i * cell_h, (i + 1) * cell_h
-            x_start, x_end = j * cell_w, (j + 1) * cell_w
-            cell = frame[y_start:y_end, x_start:x_end]
-            hist = compute_lab_histogram_for_cell(cell, n_bins)
-            histograms.append(hist)
 
-    return histograms
+    # Quantize the whole frame once, then count every (cell, bin) pair with one bincount
+    bin_indices = quantize_lab_image(frame[:r * cell_h, :r * cell_w])
+    cell_indices = get_cell_index_map(r, cell_h, cell_w)
+    counts = np.bincount((cell_indices * n_bins + bin_indices).ravel(), minlength=r * r * n_bins)
 
-def extract_histograms_from_frames(video_path, r, n_bins):
-    """Extract LAB histograms from the first, middle, and last frames of a video."""
-    # Get the key frames (first, middle, last)
-    first_frame, middle_frame, last_frame = get_key_frames(video_path)
+    return list(counts.reshape(r * r, n_bins))
 
+def histograms_from_key_frames(key_frames, r, n_bins):
+    """Concatenate the cell histograms of already decoded key frames; missing frames are skipped."""
     all_histograms = []
 
-    for frame in [first_frame, middle_frame, last_frame]:
+    for frame in key_frames:
         if frame is not None:
             frame_histograms = process_frame_in_cells(frame, r, n_bins)
             all_histograms.extend(frame_histograms)  # Add histograms to the list
@@ -102,6 +272,30 @@ def extract_histograms_from_frames(video_path, r, n_bins):
     else:
         return None
 
+def col_hist_model_id(r, n_bins):
+    """Feature cache id of the COL-HIST histograms for an r x r grid and n_bins bins."""
+    return f"COL-HIST-{r}x{r}-{n_bins}"
+
+def extract_histograms_from_frames(video_path, r, n_bins, use_feature_cache=True):
+    """
+    Extract LAB histograms from the first, middle, and last frames of a video.
+
+    With use_feature_cache, a histogram already in the feature cache (or in the corpus)
+    is returned without reading the video, and a newly computed one is cached.
+    """
+    model = col_hist_model_id(r, n_bins)
+    if use_feature_cache:
+        histogram = feature_cache.lookup(video_path, model)
+        if histogram is not None:
+            return histogram
+
+    # Get the key frames (first, middle, last)
+    histogram = histograms_from_key_frames(get_key_frames(video_path), r, n_bins)
+
+    if use_feature_cache and histogram is not None:
+        feature_cache.store(video_path, model, histogram)
+    return histogram
+
 if __name__ == "__main__":
     # Example video path
     video_path = '../hmdb51_extracted/non_target_videos/brush_hair/April_09_brush_hair_u_nm_np1_ba_goo_0.avi'
@@ -0,0 +1,223 @@
+import os
+import glob
+import threading
+import numpy as np
+from manifest import Manifest, file_hash, resolve_path
+from feature_store import load_features
+from profiling import profiler
+
+# Content-addressed cache of per-video features, so repeated queries (and queries for
+# videos that are already in the corpus) skip decoding and inference:
+#
+#   feature = feature_cache.lookup(video_path, "R3D18-AvgPool-512")
+#   if feature is None:
+#       feature = ...
+#       feature_cache.store(video_path, "R3D18-AvgPool-512", feature)
+#
+# Entries are keyed by the SHA-1 of the input file plus a model id and kept as .npy
+# files; the least recently used ones are evicted once the cache exceeds max_bytes.
+# On a miss, the corpus feature files are searched through the build manifests,
+# which record the content hash of every video they contain. Without a manifest (e.g.
+# the committed corpus), a row with the same folder and file name is used if its
+# stored video is on disk with the same content. BOF-960 is not served from the
+# corpus: nothing records which codebook built processed_histograms.csv.
+
+TASK4_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(TASK4_DIR, "feature_cache")
+MAX_BYTES = 256 * 1024 * 1024
+
+# Corpus feature file of each model id that can be served from the corpus
+CORPUS_FILES = {
+    "R3D18-Layer3-512": os.path.join(TASK4_DIR, "features_layer3.csv"),
+    "R3D18-Layer4-512": os.path.join(TASK4_DIR, "features_layer4.csv"),
+    "R3D18-AvgPool-512": os.path.join(TASK4_DIR, "features_avgpool.csv"),
+    "COL-HIST-4x4-12": os.path.join(TASK4_DIR, "histograms.csv"),
+}
+
+# {absolute path: ((size, mtime_ns), sha1)}
+_hashes = {}
+
+def content_hash(file_path):
+    """SHA-1 of a file, recomputed only when its size or mtime changes."""
+    stat = os.stat(file_path)
+    key = os.path.abspath(file_path)
+    version = (stat.st_size, stat.st_mtime_ns)
+
+    if key not in _hashes or _hashes[key][0] != version:
+        _hashes[key] = (version, file_hash(file_path))
+    return _hashes[key][1]
+
+def name_key(path):
+    """(folder, file name) of a path, e.g. ("wave", "clip.avi"); the corpus stores relative paths."""
+    return tuple(os.path.normpath(path).split(os.sep)[-2:])
+
+class CorpusLookup:
+    """
+    Find corpus rows by content hash, via the *.manifest.json files next to the corpus
+    feature files, or when there is no manifest by folder and file name, provided the
+    stored video is on disk with the same content.
+    """
+
+    def __init__(self, corpus_files=CORPUS_FILES):
+        self.corpus_files = corpus_files
+        self.lock = threading.Lock()
+        self._manifests = {}  # {directory: (manifest versions, {hash: [paths]})}
+        self._rows = {}  # {csv path: (paths list, {path: row}, {name key: [rows]})}
+
+    def paths_for_hash(self, directory, content_hash):
+        """Video paths recorded with this content hash in the manifests of a directory, or None without manifests."""
+        manifest_files = sorted(glob.glob(os.path.join(directory, "*.manifest.json")))
+        versions = [(path, os.path.getmtime(path)) for path in manifest_files]
+
+        if directory not in self._manifests or self._manifests[directory][0] != versions:
+            by_hash = {}
+            for manifest_file in manifest_files:
+                for video_path, entry in Manifest(manifest_file).entries.items():
+                    by_hash.setdefault(entry["hash"], []).append(video_path)
+            self._manifests[directory] = (versions, by_hash)
+
+        if not manifest_files:
+            return None
+        return self._manifests[directory][1].get(content_hash, [])
+
+    def row_index(self, csv_path):
+        """
+        (matrix, {absolute path: row}, {name key: [rows]}) of a corpus feature file,
+        rebuilt when its store changes. Stored paths are relative to the CSV's directory.
+        """
+        _, paths, matrix = load_features(csv_path)
+        if csv_path not in self._rows or self._rows[csv_path][0] is not paths:
+            base_dir = os.path.dirname(csv_path)
+            by_name = {}
+            for row, path in enumerate(paths):
+                by_name.setdefault(name_key(path), []).append(row)
+            self._rows[csv_path] = (paths, {resolve_path(path, base_dir): row for row, path in enumerate(paths)}, by_name)
+        return matrix, self._rows[csv_path][1], self._rows[csv_path][2]
+
+    @staticmethod
+    def same_content(stored_path, csv_path, digest):
+        """Whether a stored corpus path (relative to the CSV's directory) is on disk with this content hash."""
+        path = resolve_path(stored_path, os.path.dirname(csv_path))
+        return os.path.isfile(path) and content_hash(path) == digest
+
+    def get(self, digest, model, file_path=None):
+        """Return the corpus feature of the file with this content hash (named file_path), or None."""
+        csv_path = self.corpus_files.get(model)
+        if csv_path is None or not os.path.exists(csv_path):
+            return None
+
+        with self.lock:
+            matrix, rows, by_name = self.row_index(csv_path)
+
+            video_paths = self.paths_for_hash(os.path.dirname(csv_path), digest)
+            if video_paths is not None:
+                for video_path in video_paths:
+                    if video_path in rows:
+                        return np.array(matrix[rows[video_path]])
+                return None
+
+            if file_path is None:
+                return None
+            paths = self._rows[csv_path][0]
+            for row in by_name.get(name_key(file_path), []):
+                if self.same_content(paths[row], csv_path, digest):
+                    return np.array(matrix[row])
+        return None
+
+class FeatureCache:
+    """Disk cache of features keyed by (content hash, model id) with size-bounded LRU eviction."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES, corpus=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.corpus = corpus
+        self.lock = threading.Lock()
+        self.size = None  # Bytes on disk, counted on first store
+
+    def entry_path(self, content_hash, model):
+        return os.path.join(self.cache_dir, content_hash[:2], f"{content_hash}.{model}.npy")
+
+    def get(self, content_hash, model):
+        """Return the cached feature, or None; a hit marks the entry as recently used."""
+        path = self.entry_path(content_hash, model)
+        try:
+            feature = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return feature
+
+    def put(self, content_hash, model, feature):
+        """Write a feature atomically, then evict old entries if the cache is over its bound."""
+        path = self.entry_path(content_hash, model)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, mode="wb") as file:
+            np.save(file, np.asarray(feature))
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.entries())
+            else:
+                self.size += os.path.getsize(path)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+        """(path, size, last use) of every entry on disk."""
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*", "*.npy")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """Delete the least recently used entries until the cache is within max_bytes."""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.size = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            profiler.count("feature_cache_evictions")
+
+    def lookup(self, file_path, model):
+        """
+        Return the feature of a model for a file from the cache or the corpus, or None.
+
+        Corpus hits are copied into the cache so the next lookup is a single file read.
+        """
+        with profiler.timer("feature_cache"):
+            digest = content_hash(file_path)
+
+            feature = self.get(digest, model)
+            if feature is not None:
+                profiler.count("feature_cache_hits")
+                return feature
+
+            if self.corpus is not None:
+                feature = self.corpus.get(digest, model, file_path)
+                if feature is not None:
+                    profiler.count("corpus_hits")
+                    self.put(digest, model, feature)
+                    return feature
+
+            profiler.count("feature_cache_misses")
+            return None
+
+    def store(self, file_path, model, feature):
+        """Cache the feature a model computed for a file."""
+        self.put(content_hash(file_path), model, feature)
+
+# Process-wide cache used by the extract functions
+feature_cache = FeatureCache(corpus=CorpusLookup())
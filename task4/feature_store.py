@@ -0,0 +1,142 @@
+import os
+import sys
+import csv
+import glob
+import itertools
+import numpy as np
+from profiling import profiler
+
+# Each corpus CSV "name.csv" (id column, path column, feature columns...) is stored as:
+#   name.npy        contiguous float32 (rows, features) matrix, opened memory-mapped
+#   name.index.csv  the id and path columns, row-aligned with the matrix
+
+def store_paths(csv_path):
+    """Return the (matrix, index) file paths of the store that belongs to a CSV file."""
+    base, _ = os.path.splitext(csv_path)
+    return base + ".npy", base + ".index.csv"
+
+def is_fresh(csv_path):
+    """Check if the binary store exists and is not older than its CSV."""
+    matrix_path, index_path = store_paths(csv_path)
+    if not (os.path.exists(matrix_path) and os.path.exists(index_path)):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return min(os.path.getmtime(matrix_path), os.path.getmtime(index_path)) >= os.path.getmtime(csv_path)
+
+def store_version(csv_path):
+    """Modification times of a CSV and its store files; they change whenever the corpus is rebuilt or converted."""
+    return tuple(os.path.getmtime(path) if os.path.exists(path) else None
+                 for path in [csv_path, *store_paths(csv_path)])
+
+def save_store(csv_path, id_column, path_column, ids, paths, matrix):
+    """Write a matrix and its id/path index as the store for csv_path."""
+    matrix_path, index_path = store_paths(csv_path)
+
+    # Write to temporary files first so readers never see a half-written store
+    np.save(matrix_path + ".tmp.npy", np.ascontiguousarray(matrix, dtype=np.float32))
+    with open(index_path + ".tmp", mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow([id_column, path_column])
+        writer.writerows(zip(ids, paths))
+
+    os.replace(matrix_path + ".tmp.npy", matrix_path)
+    os.replace(index_path + ".tmp", index_path)
+
+def csv_records(file):
+    """Yield the records of an open CSV file, skipping blank lines; quoted fields may span lines."""
+    for record in csv.reader(file):
+        if record:
+            yield record
+
+@profiler.timed("convert_csv")
+def convert_csv(csv_path, chunk_size=10000):
+    """Convert a corpus CSV into the binary store, reading it in chunks to keep memory flat."""
+    matrix_path, index_path = store_paths(csv_path)
+
+    # Rows are counted by the same reader that fills the matrix, so they always line up
+    with open(csv_path, mode="r", newline="") as file:
+        records = csv_records(file)
+        header = next(records)
+        num_rows = sum(1 for _ in records)
+
+    # Fill a memory-mapped .npy chunk by chunk
+    tmp_matrix_path = matrix_path + ".tmp.npy"
+    matrix = np.lib.format.open_memmap(tmp_matrix_path, mode="w+", dtype=np.float32,
+                                       shape=(num_rows, len(header) - 2))
+
+    with open(csv_path, mode="r", newline="") as source, open(index_path + ".tmp", mode="w", newline="") as file:
+        records = csv_records(source)
+        next(records)  # Skip header
+        writer = csv.writer(file)
+        writer.writerow(header[:2])
+
+        row = 0
+        for chunk in iter(lambda: list(itertools.islice(records, chunk_size)), []):
+            matrix[row:row + len(chunk)] = np.array([record[2:] for record in chunk], dtype=np.float32)
+            writer.writerows(record[:2] for record in chunk)
+            row += len(chunk)
+
+    if row != num_rows:
+        raise ValueError(f"{csv_path} changed while it was being converted")
+
+    matrix.flush()
+    del matrix
+
+    os.replace(tmp_matrix_path, matrix_path)
+    os.replace(index_path + ".tmp", index_path)
+
+def load_store(csv_path):
+    """Open the store of csv_path: returns (ids, paths, memory-mapped float32 matrix)."""
+    matrix_path, index_path = store_paths(csv_path)
+
+    matrix = np.load(matrix_path, mmap_mode="r")
+
+    ids = []
+    paths = []
+    with open(index_path, mode="r", newline="") as file:
+        reader = csv.reader(file)
+        next(reader)  # Skip header
+        for row in reader:
+            ids.append(row[0])
+            paths.append(row[1])
+
+    return ids, paths, matrix
+
+# Opened stores kept for the lifetime of the process, keyed by CSV path
+_opened_stores = {}
+
+@profiler.timed("load_features")
+def load_features(csv_path):
+    """
+    Load a corpus feature file as (ids, paths, float32 matrix).
+
+    Uses the binary store next to the CSV, converting the CSV once if the store is
+    missing or stale. Opened stores are reused until the store file changes.
+    """
+    if not is_fresh(csv_path):
+        print(f"Converting {csv_path} to binary feature store")
+        convert_csv(csv_path)
+
+    matrix_path, _ = store_paths(csv_path)
+    key = os.path.abspath(csv_path)
+    version = os.path.getmtime(matrix_path)
+
+    if key not in _opened_stores or _opened_stores[key][0] != version:
+        _opened_stores[key] = (version, load_store(csv_path))
+
+    return _opened_stores[key][1]
+
+def main():
+    # Convert the given CSV files, or every CSV in task4
+    csv_files = sys.argv[1:] or glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.csv"))
+
+    for csv_path in csv_files:
+        if csv_path.endswith(".index.csv"):
+            continue
+        convert_csv(csv_path)
+        ids, _, matrix = load_store(csv_path)
+        print(f"Converted {csv_path}: {len(ids)} rows x {matrix.shape[1]} features")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import os
+import csv
+import json
+import hashlib
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """SHA-1 of a file's content."""
+    digest = hashlib.sha1()
+    with open(file_path, mode="rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def resolve_path(path, base_dir="."):
+    """
+    Absolute form of a path given relative to base_dir. Output CSVs store paths
+    relative to their own directory (e.g. ../hmdb51_extracted/... in task4/), while
+    builders get paths relative to the working directory.
+    """
+    return os.path.normpath(os.path.join(os.path.abspath(base_dir), path))
+
+class Manifest:
+    """
+    Record of the videos whose results are committed to a builder's output files,
+    keyed by absolute path with size, mtime and content hash. Methods take paths
+    relative to the working directory or absolute.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        self.exists = os.path.exists(manifest_path)
+        if self.exists:
+            with open(manifest_path, mode="r") as file:
+                # Older manifests were keyed by the paths the builder was given
+                self.entries = {resolve_path(path): entry for path, entry in json.load(file)["videos"].items()}
+
+    def plan(self, video_files):
+        """
+        Split video_files into (pending, removed): pending videos are new or changed,
+        removed ones are in the manifest but no longer on disk.
+
+        A video whose size or mtime changed but whose content hash did not is kept
+        as it is, with its stat refreshed. Adopted entries without a hash are never
+        reported as removed.
+        """
+        pending = []
+        for video_file in video_files:
+            entry = self.entries.get(resolve_path(video_file))
+            if entry is None:
+                pending.append(video_file)
+                continue
+
+            stat = os.stat(video_file)
+            if stat.st_size == entry["size"] and stat.st_mtime == entry["mtime"]:
+                continue
+
+            if stat.st_size == entry["size"] and file_hash(video_file) == entry["hash"]:
+                entry["mtime"] = stat.st_mtime
+                continue
+
+            pending.append(video_file)
+
+        on_disk = {resolve_path(video_file) for video_file in video_files}
+        removed = [video_path for video_path, entry in self.entries.items()
+                   if video_path not in on_disk and entry["hash"] is not None]
+
+        return pending, removed
+
+    def adopt(self, video_paths, video_files):
+        """
+        Seed a new manifest with the videos whose rows are already in the outputs (e.g.
+        a corpus built before manifests were kept), so the first run keeps those rows
+        instead of pruning them as untracked.
+
+        video_paths are absolute, as committed_paths returns them. Videos among
+        video_files are recorded as they are now. The others get an entry without
+        stat or hash: their rows are kept, and they are reprocessed if they show up
+        in a later run.
+        """
+        on_disk = {resolve_path(video_file) for video_file in video_files}
+        for video_path in video_paths:
+            if video_path in on_disk:
+                self.record([video_path])
+            else:
+                self.entries[video_path] = {"size": None, "mtime": None, "hash": None}
+
+    def record(self, video_files):
+        """Mark videos as committed with their current size, mtime and hash."""
+        for video_file in video_files:
+            stat = os.stat(video_file)
+            self.entries[resolve_path(video_file)] = {"size": stat.st_size, "mtime": stat.st_mtime,
+                                                      "hash": file_hash(video_file)}
+
+    def forget(self, video_files):
+        """Drop videos from the manifest."""
+        for video_file in video_files:
+            self.entries.pop(resolve_path(video_file), None)
+
+    def save(self):
+        """Write the manifest atomically."""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, mode="w") as file:
+            json.dump({"videos": self.entries}, file)
+        os.replace(tmp_path, self.manifest_path)
+
+def read_csv_paths(csv_path, path_column=1):
+    """Set of the video paths in an output CSV's path column, made absolute with resolve_path."""
+    base_dir = os.path.dirname(csv_path)
+    with open(csv_path, mode="r", newline="") as file:
+        reader = csv.reader(file)
+        next(reader, None)  # Header
+        return {resolve_path(row[path_column], base_dir) for row in reader if row}
+
+def csv_row_path(video_file, csv_path):
+    """Path of a video as stored in an output CSV: relative to the CSV's directory."""
+    return os.path.relpath(video_file, os.path.dirname(os.path.abspath(csv_path)))
+
+def committed_paths(csv_paths, path_column=1):
+    """Absolute video paths that have a row in every existing CSV of csv_paths."""
+    paths = None
+    for csv_path in csv_paths:
+        if os.path.exists(csv_path):
+            rows = read_csv_paths(csv_path, path_column)
+            paths = rows if paths is None else paths & rows
+    return paths or set()
+
+def reconcile_csv(csv_path, keep_paths, path_column=1):
+    """
+    Remove output rows whose video path is not in keep_paths, e.g. rows of changed
+    or removed videos, or rows written by a chunk that crashed before its manifest
+    update. Row paths are resolved against the CSV's directory and keep_paths
+    against the working directory. Returns the number of rows removed.
+    """
+    if not os.path.exists(csv_path):
+        return 0
+
+    keep_paths = {resolve_path(path) for path in keep_paths}
+    base_dir = os.path.dirname(csv_path)
+    removed = 0
+    tmp_path = csv_path + ".tmp"
+    with open(csv_path, mode="r", newline="") as source, open(tmp_path, mode="w", newline="") as target:
+        reader = csv.reader(source)
+        writer = csv.writer(target)
+        writer.writerow(next(reader))  # Header
+        for row in reader:
+            if resolve_path(row[path_column], base_dir) in keep_paths:
+                writer.writerow(row)
+            else:
+                removed += 1
+
+    if removed:
+        os.replace(tmp_path, csv_path)
+    else:
+        os.remove(tmp_path)
+
+    return removed
+
+def prepare_incremental_build(manifest_path, video_files, csv_paths, path_column=1):
+    """
+    Load the manifest of a build, drop stale rows from its output CSVs and return
+    (manifest, videos still to process).
+    """
+    manifest = Manifest(manifest_path)
+    if not manifest.exists:
+        manifest.adopt(committed_paths(csv_paths, path_column), video_files)
+        if manifest.entries:
+            print(f"Adopted {len(manifest.entries)} videos already in the outputs into {manifest_path}")
+
+    pending, removed = manifest.plan(video_files)
+
+    manifest.forget(pending + removed)
+    manifest.save()
+
+    keep_paths = set(manifest.entries)
+    dropped = 0
+    for csv_path in csv_paths:
+        dropped_rows = reconcile_csv(csv_path, keep_paths, path_column)
+        if dropped_rows:
+            print(f"Removed {dropped_rows} stale rows from {csv_path}")
+        dropped += dropped_rows
+
+    print(f"{len(video_files) - len(pending)} videos up to date, {len(pending)} to process, {len(removed)} removed, "
+          f"{dropped} stale rows dropped")
+    return manifest, pending
@@ -0,0 +1,93 @@
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+# Named timers and counters around the pipeline stages. They are always on and cost
+# about a microsecond per call, so the hot paths can stay instrumented:
+#
+#   with profiler.timer("decode"):
+#       ...
+#   profiler.count("frames_decoded", 32)
+#
+#   @profiler.timed("read_stip_file")
+#   def read_stip_file(...):
+
+class Profiler:
+    """Accumulates seconds and calls per timer name and totals per counter name."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = {}  # {name: [seconds, calls]}
+        self.counters = {}
+
+    @contextmanager
+    def timer(self, name):
+        """Time the enclosed block under name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                totals = self.timers.setdefault(name, [0.0, 0])
+                totals[0] += elapsed
+                totals[1] += 1
+
+    def timed(self, name):
+        """Decorator that times every call of a function under name."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, amount=1):
+        """Add amount to the counter name."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        """Forget every timer and counter."""
+        with self.lock:
+            self.timers = {}
+            self.counters = {}
+
+    def snapshot(self):
+        """Return the current timers and counters as plain data."""
+        with self.lock:
+            return {
+                "timers": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.timers.items()},
+                "counters": dict(self.counters),
+            }
+
+    def merge(self, snapshot):
+        """Add a snapshot taken elsewhere, e.g. in a worker process, to these totals."""
+        with self.lock:
+            for name, timer in snapshot["timers"].items():
+                totals = self.timers.setdefault(name, [0.0, 0])
+                totals[0] += timer["seconds"]
+                totals[1] += timer["calls"]
+            for name, amount in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def write_json(self, path, **metadata):
+        """Write the snapshot with extra metadata (e.g. the query and wall time) to a JSON file."""
+        with open(path, mode="w") as file:
+            json.dump({**metadata, **self.snapshot()}, file, indent=2)
+        print(f"Profile written to {path}")
+
+# Process-wide profiler used by the instrumented stages
+profiler = Profiler()
+
+def call_profiled(function, *args, **kwargs):
+    """
+    Run function in a worker process and return (result, snapshot) so the parent can
+    merge the worker's timings; the worker's totals are reset first.
+    """
+    profiler.reset()
+    result = function(*args, **kwargs)
+    return result, profiler.snapshot()
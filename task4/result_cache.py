@@ -0,0 +1,64 @@
+import threading
+from collections import OrderedDict
+from profiling import profiler
+
+# In-memory LRU of neighbour search results, so repeated "top k of video X" queries
+# skip extraction and the corpus scan:
+#
+#   results = result_cache.get(video_hash, model, distance, k, version)
+#   if results is None:
+#       results = ...
+#       result_cache.put(video_hash, model, distance, k, version, results)
+#
+# version identifies the corpus state a result was computed against (e.g. the
+# store_version of its corpus file and the ANN index mtime); a result whose version
+# differs from the current one is dropped. A query for k results is answered from a
+# cached entry with k or more results.
+
+MAX_ENTRIES = 4096
+
+class ResultCache:
+    """LRU of top-k results keyed by (video hash, model, distance function)."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # {(video hash, model, distance): (version, k, results)}
+
+    def get(self, video_hash, model, distance, k, version):
+        """Return the first k results of a cached query, or None on a miss."""
+        key = (video_hash, model, distance)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] != version:
+                # The corpus changed since the result was computed
+                del self.entries[key]
+                entry = None
+
+            # A cached list shorter than its k already holds every corpus row
+            if entry is None or (k > entry[1] and len(entry[2]) == entry[1]):
+                profiler.count("result_cache_misses")
+                return None
+
+            self.entries.move_to_end(key)
+            profiler.count("result_cache_hits")
+            return entry[2][:k]
+
+    def put(self, video_hash, model, distance, k, version, results):
+        """Cache the top k results of a query, keeping an existing entry with a larger k."""
+        key = (video_hash, model, distance)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version or entry[1] < k:
+                self.entries[key] = (version, k, list(results))
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+# Process-wide cache used by task5
+result_cache = ResultCache()
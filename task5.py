@@ -1,20 +1,43 @@
 import sys
 import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tabulate import tabulate
 import textwrap
 
-# Add task1, task2, and task3 directories to the Python path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'task1')))
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'task2')))
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'task3')))
-from task1.compare_features import R3D18
-from task2.euclidean_neighbours import bof_960
-from task3.get_closest_neighbours import (
-    process_video_COL_HIST,
-    # Import other model functions here
-)
-
-def process_video(video_path, model_name, top_k=10):
+# Add task1, task2, task3 and task4 directories to the Python path
+for task_dir in ['task1', 'task2', 'task3', 'task4']:
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), task_dir)))
+from profiling import profiler
+from feature_store import store_version
+from feature_cache import feature_cache, content_hash
+from result_cache import result_cache
+
+# The model modules (torch and torchvision for R3D18, scipy and pandas for BOF-960,
+# OpenCV for COL-HIST) are imported inside the functions that need them, so a query
+# only loads what its selected models use.
+
+# Models in the order they are reported
+MODELS = [
+    "R3D18-Layer3-512",
+    "R3D18-Layer4-512",
+    "R3D18-AvgPool-512",
+    "BOF-960",
+    "COL-HIST"
+]
+
+# R3D18 inference modes that --inference-mode accepts: inference_modes.UNCALIBRATED_MODES,
+# listed here so parsing the arguments does not import torch
+INFERENCE_MODES = ["eager", "traced", "compile", "channels_last_3d", "bf16"]
+
+# Corpus feature file searched by each model (the R3D18 ones are in compare_features.CSV_FILES)
+CORPUS_FILES = {
+    "BOF-960": "./task4/processed_histograms.csv",
+    "COL-HIST": "./task4/histograms.csv",
+}
+
+def process_video(video_path, model_name, top_k=10, r3d18_features=None, use_ann=False, col_hist=None):
     """
     Process a single video with a given model, and return the top k closest videos.
     
@@ -22,27 +45,186 @@ def process_video(video_path, model_name, top_k=10):
         video_path (str): Path to the video file.
         model_name (str): The model name to use for processing.
         top_k (int): The number of closest videos to return.
+        r3d18_features (dict): Optional {layer: feature} from extract_features, reused by the R3D18 models.
+        use_ann (bool): Search the approximate R3D18 ANN indexes instead of every corpus row.
+        col_hist (np.ndarray): Optional precomputed COL-HIST histogram of the video.
     
     Returns:
         list: Top k closest video file names.
     """
     # Call the appropriate model function based on model_name
     if model_name == "COL-HIST":
-        return process_video_COL_HIST(video_path, "./task4/histograms.csv", "intersection", top_k)
+        from get_closest_neighbours import process_video_COL_HIST
+        return process_video_COL_HIST(video_path, CORPUS_FILES["COL-HIST"], "intersection", top_k, col_hist)
     
     # Add elif statements for other models
     elif model_name == "BOF-960":
-        return bof_960(video_path + ".txt", "./task4/processed_histograms.csv", top_k)
-    elif model_name == "R3D18-AvgPool-512":
-        return R3D18(video_path, "R3D18-AvgPool-512", top_k)
-    elif model_name == "R3D18-Layer4-512":
-        return R3D18(video_path, "R3D18-Layer4-512", top_k)
-    elif model_name == "R3D18-Layer3-512":
-        return R3D18(video_path, "R3D18-Layer3-512", top_k)
+        from euclidean_neighbours import bof_960
+        return bof_960(video_path + ".txt", CORPUS_FILES["BOF-960"], top_k)
+    elif model_name in ["R3D18-AvgPool-512", "R3D18-Layer4-512", "R3D18-Layer3-512"]:
+        from compare_features import R3D18
+        return R3D18(video_path, model_name, top_k, _layer_feature(r3d18_features, model_name), use_ann)
     
     else:
         raise ValueError(f"Model '{model_name}' is not recognized. Please choose a valid model.")
 
+def _mtime(path):
+    return os.path.getmtime(path) if os.path.exists(path) else None
+
+def corpus_version(video_path, model, use_ann=False):
+    """
+    Version of everything besides the query video that a model's results depend on:
+    its corpus file and store, the ANN index, and for BOF-960 the STIP file and codebook.
+    """
+    if model.startswith("R3D18"):
+        from compare_features import CSV_FILES, ann_index_path
+        from feature_extraction import feature_id
+
+        # The feature id changes with the R3D18 weights
+        version = store_version(CSV_FILES[model]) + (feature_id(model),)
+        if use_ann:
+            version += (_mtime(ann_index_path(model)),)
+        return version
+
+    version = store_version(CORPUS_FILES[model])
+    if model == "BOF-960":
+        from get_features import HOG_CLUSTER_FILE, HOF_CLUSTER_FILE, stip_file_path
+        version += (_mtime(stip_file_path(video_path + ".txt")), _mtime(HOG_CLUSTER_FILE), _mtime(HOF_CLUSTER_FILE))
+    return version
+
+def _input_file(video_path, model):
+    """The file a model reads for a query: the STIP file for BOF-960, the video for the others."""
+    if model == "BOF-960":
+        from get_features import stip_file_path
+        return stip_file_path(video_path + ".txt")
+    return video_path
+
+def _result_cache_distance(model, use_ann):
+    """Distance function name a model's results are cached under."""
+    if model.startswith("R3D18") and use_ann:
+        return get_distance_function(model) + " (ANN)"
+    return get_distance_function(model)
+
+def _feature_cache_id(model):
+    """Feature cache id of the query feature of a model whose input is the decoded video, else None."""
+    if model.startswith("R3D18"):
+        from feature_extraction import feature_id
+        return feature_id(model)
+    if model == "COL-HIST":
+        from video_histograms import col_hist_model_id
+        from get_closest_neighbours import R, N_BINS
+        return col_hist_model_id(R, N_BINS)
+    return None
+
+def _decode_video(video_path):
+    """Decode the R3D18 clip and the COL-HIST key frames of a video in one pass."""
+    from video_histograms import decode_video
+    from feature_extraction import NUM_FRAMES, FRAME_SIZE
+    return decode_video(video_path, NUM_FRAMES, FRAME_SIZE)
+
+def _r3d18_features(video_path, decoded):
+    """Run R3D18 once on the decoded clip, cache and return {layer: feature} for all three layers."""
+    from feature_extraction import clip_to_tensor, extract_features_batch, feature_id
+
+    clip, _ = decoded.result()
+    with profiler.timer("extract_features"):
+        features = extract_features_batch([clip_to_tensor(clip)])[0]
+
+    for layer, feature in features.items():
+        feature_cache.store(video_path, feature_id(layer), feature)
+    return features
+
+def _run_model(video_path, model, top_k, feature, decoded, r3d18, use_ann):
+    """Wait for the inputs a model needs (unless its feature was cached), then run its search."""
+    if feature is None and model.startswith("R3D18"):
+        feature = r3d18.result()[model]
+    elif feature is None and model == "COL-HIST" and decoded is not None:
+        from video_histograms import histograms_from_key_frames
+        from get_closest_neighbours import R, N_BINS
+
+        _, key_frames = decoded.result()
+        feature = histograms_from_key_frames(key_frames, R, N_BINS)
+        if feature is None:
+            raise ValueError("No histogram available for the video")
+        feature_cache.store(video_path, _feature_cache_id(model), feature)
+
+    r3d18_features = {model: feature} if model.startswith("R3D18") else None
+    col_hist = feature if model == "COL-HIST" else None
+
+    with profiler.timer(f"model:{model}"):
+        return process_video(video_path, model, top_k, r3d18_features, use_ann, col_hist)
+
+def process_video_models(video_path, models=MODELS, top_k=10, use_ann=False):
+    """
+    Yield (model_name, top k closest videos) for each model as soon as it finishes.
+
+    Results of earlier queries for the same input content (the video, or the STIP
+    file for BOF-960) are served from the result cache while their corpus version
+    is unchanged; a model whose input is missing is run without the cache. Features found in the
+    feature cache (or in the corpus, for corpus videos) are used as they are.
+    Otherwise the video is decoded once for R3D18 and COL-HIST (COL-HIST reads
+    only its key frames when no R3D18 model needs the clip), R3D18 runs once for
+    all its layers, and the models run concurrently on threads (decoding, the
+    forward pass and the distance kernels release the GIL), so a query takes
+    about as long as its slowest model. Only the modules of the selected models
+    are imported.
+    """
+    for model in models:
+        if model not in MODELS:
+            raise ValueError(f"Model '{model}' is not recognized. Please choose a valid model.")
+
+    input_hashes = {}  # {input file: content hash, None if it does not exist}
+    hashes = {}
+    versions = {}
+    pending = []
+    for model in models:
+        input_file = _input_file(video_path, model)
+        if input_file not in input_hashes:
+            input_hashes[input_file] = content_hash(input_file) if os.path.exists(input_file) else None
+        hashes[model] = input_hashes[input_file]
+        versions[model] = corpus_version(video_path, model, use_ann)
+
+        results = None
+        if hashes[model] is not None:
+            results = result_cache.get(hashes[model], model, _result_cache_distance(model, use_ann), top_k, versions[model])
+        if results is None:
+            pending.append(model)
+        else:
+            yield model, results
+
+    if not pending:
+        return
+    models = pending
+
+    cached = {}
+    for model in models:
+        if _feature_cache_id(model) is not None:
+            cached[model] = feature_cache.lookup(video_path, _feature_cache_id(model))
+    uncached = [model for model, feature in cached.items() if feature is None]
+
+    # One thread per model plus the decode and the R3D18 forward pass they wait on
+    with ThreadPoolExecutor(max_workers=len(models) + 2) as executor:
+        decoded = r3d18 = None
+        if any(model.startswith("R3D18") for model in uncached):
+            decoded = executor.submit(_decode_video, video_path)
+            r3d18 = executor.submit(_r3d18_features, video_path, decoded)
+
+        futures = {executor.submit(_run_model, video_path, model, top_k, cached.get(model), decoded, r3d18, use_ann): model
+                   for model in models}
+
+        for future in as_completed(futures):
+            model = futures[future]
+            results = future.result()
+            if results and hashes[model] is not None:
+                result_cache.put(hashes[model], model, _result_cache_distance(model, use_ann), top_k, versions[model], results)
+            yield model, results
+
+def _layer_feature(r3d18_features, layer):
+    """Pick one layer out of precomputed R3D18 features, if any."""
+    if r3d18_features is None:
+        return None
+    return r3d18_features.get(layer)
+
 def get_distance_function(model_name):
     """
     Get the distance function used for a given model.
@@ -90,33 +272,43 @@ def print_results_table(model_name, results, input_video_filename):
     print(tabulate(table, headers=headers, tablefmt='grid'))
 
 if __name__ == "__main__":
-    # Read command-line arguments
-    if len(sys.argv) != 3:
-        print("Usage: python task5.py <video_path> <top_k>")
-        sys.exit(1)
-
-    video_path = sys.argv[1]
-    try:
-        top_k = int(sys.argv[2])
-    except ValueError:
-        print("Error: <top_k> must be an integer.")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Find the closest corpus videos to a video with every model.")
+    parser.add_argument("video_path")
+    parser.add_argument("top_k", type=int)
+    parser.add_argument("--server", help="Send the query to a running query_server.py, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--models", nargs="+", default=MODELS, choices=MODELS, help="Models to query (default: all five)")
+    parser.add_argument("--ann", action="store_true", help="Use the approximate ANN indexes for the R3D18 models")
+    parser.add_argument("--weights", help="R3D18 state dict to load (memory-mapped) instead of the default initialisation")
+    parser.add_argument("--inference-mode", choices=INFERENCE_MODES, help="R3D18 inference mode from task1/inference_modes.py (default: eager)")
+    parser.add_argument("--profile", nargs="?", const="query_profile.json", help="Write a JSON timing breakdown of the query")
+    args = parser.parse_args()
+
+    video_path = args.video_path
+    top_k = args.top_k
+    models = args.models
+
+    if args.weights:
+        os.environ["R3D18_WEIGHTS"] = args.weights
+    if args.inference_mode:
+        os.environ["R3D18_INFERENCE_MODE"] = args.inference_mode
 
     # Extract video filename from the path
     input_video_filename = os.path.basename(video_path)
 
-    # List of models to process
-    models = [
-        "R3D18-Layer3-512",
-        "R3D18-Layer4-512",
-        "R3D18-AvgPool-512",
-        "BOF-960",
-        "COL-HIST"
-    ]
-    
-    for model in models:
-        print(f"\nProcessing with model '{model}' using distance function '{get_distance_function(model)}'...")
-        closest_videos = process_video(video_path, model, top_k)
-        
-        # Print results for each model
-        print_results_table(model, closest_videos, input_video_filename)
\ No newline at end of file
+    start = time.perf_counter()
+
+    if args.server:
+        from query_server import send_query
+        results = send_query(args.server, os.path.abspath(video_path), models, top_k)
+        for model in models:
+            print_results_table(model, results[model], input_video_filename)
+    else:
+        for model, closest_videos in process_video_models(video_path, models, top_k, args.ann):
+            # Print results for each model as soon as it finishes
+            print_results_table(model, closest_videos, input_video_filename)
+            print(f"{model} finished after {time.perf_counter() - start:.2f}s")
+
+    print(f"\nTotal latency: {time.perf_counter() - start:.2f}s")
+
+    if args.profile:
+        profiler.write_json(args.profile, query=video_path, models=models, top_k=top_k, wall_seconds=time.perf_counter() - start)
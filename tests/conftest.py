@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The task modules import each other by bare name, as the scripts do at runtime
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for task_dir in ['task1', 'task2', 'task3', 'task4']:
+    sys.path.insert(0, os.path.join(ROOT, task_dir))
+sys.path.insert(0, ROOT)
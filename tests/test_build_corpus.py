@@ -0,0 +1,55 @@
+import csv
+from build_corpus import OUTPUT_FILES, build_corpus, output_row
+from feature_store import load_store
+from get_features import stip_file_path
+from manifest import Manifest
+
+def test_first_run_keeps_a_corpus_built_without_a_manifest(tmp_path):
+    videos = ["../hmdb51_extracted/target_videos/wave/a.avi", "../hmdb51_extracted/target_videos/wave/b.avi"]
+    for model, file_name in OUTPUT_FILES.items():
+        with open(tmp_path / file_name, mode="w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["name", "path", "value_0", "value_1"])
+            for video in videos:
+                path = stip_file_path(video + ".txt") if model == "BOF-960" else video
+                writer.writerow([video.rsplit("/", 1)[-1], path, 1.0, 2.0])
+
+    build_corpus([], str(tmp_path), num_workers=1)
+
+    for file_name in OUTPUT_FILES.values():
+        ids, _, matrix = load_store(str(tmp_path / file_name))
+        assert ids == ["a.avi", "b.avi"]
+        assert matrix.shape == (2, 2)
+    assert (tmp_path / "corpus.manifest.json").exists()
+
+def test_readme_layout_adopts_rows_stored_relative_to_task4(tmp_path, monkeypatch):
+    # python build_corpus.py hmdb51_extracted/target_videos --output-dir task4, run from the repository root
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "task4").mkdir()
+    (tmp_path / "hmdb51_extracted/target_videos/wave").mkdir(parents=True)
+    (tmp_path / "hmdb51_extracted/target_videos/wave/a.avi").write_bytes(b"a")
+    stored = ["../hmdb51_extracted/target_videos/wave/a.avi", "../hmdb51_extracted/target_videos/wave/b.avi"]
+    for model, file_name in OUTPUT_FILES.items():
+        with open(tmp_path / "task4" / file_name, mode="w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["name", "path", "value_0", "value_1"])
+            for video in stored:
+                path = stip_file_path(video + ".txt") if model == "BOF-960" else video
+                writer.writerow([video.rsplit("/", 1)[-1], path, 1.0, 2.0])
+
+    local = ["hmdb51_extracted/target_videos/wave/a.avi"]
+    for _ in range(2):
+        build_corpus(local, "task4", num_workers=1)
+
+        for model, file_name in OUTPUT_FILES.items():
+            _, paths, _ = load_store(str(tmp_path / "task4" / file_name))
+            assert paths == ([stip_file_path(video + ".txt") for video in stored] if model == "BOF-960" else stored)
+
+        # The local video is matched to its stored rows, so it is not processed and appended again
+        entries = Manifest(str(tmp_path / "task4" / "corpus.manifest.json")).entries
+        assert entries[str(tmp_path / local[0])]["hash"] is not None
+
+    # New rows are stored relative to task4 as well
+    assert output_row("COL-HIST", local[0], [1.0], "task4/histograms.csv")[1] == stored[0]
+    assert output_row("BOF-960", local[0], [1.0], "task4/processed_histograms.csv")[:2] == \
+        ["a", "../hmdb51_org_stips/target_videos/wave/a.avi.txt"]
@@ -0,0 +1,36 @@
+import csv
+import time
+import numpy as np
+import compare_features
+
+def write_features(csv_path, rows, mode="w"):
+    with open(csv_path, mode=mode, newline="") as file:
+        writer = csv.writer(file)
+        if mode == "w":
+            writer.writerow(["filename", "filepath"] + [f"feature_{i}" for i in range(rows.shape[1])])
+        for i, row in enumerate(rows):
+            writer.writerow([f"video_{i}_{row[0]:.6f}.avi", f"videos/{i}.avi"] + list(row))
+    time.sleep(0.01)  # Keep the mtimes of consecutive writes apart
+
+def test_load_index_follows_the_feature_store(tmp_path, monkeypatch):
+    csv_path = str(tmp_path / "features_layer3.csv")
+    monkeypatch.setitem(compare_features.CSV_FILES, "R3D18-Layer3-512", csv_path)
+    monkeypatch.setattr(compare_features, "_indexes", {})
+    rng = np.random.default_rng(0)
+
+    write_features(csv_path, rng.random((50, 8)))
+    index = compare_features.load_index("R3D18-Layer3-512")
+    assert index.size == 50
+    assert compare_features.load_index("R3D18-Layer3-512") is index
+
+    # Appended rows are added without retraining the centroids
+    write_features(csv_path, rng.random((10, 8)), mode="a")
+    extended = compare_features.load_index("R3D18-Layer3-512")
+    assert extended.size == 60 and index.size == 50
+    np.testing.assert_array_equal(extended.centroids, index.centroids)
+
+    # A rewritten store rebuilds the index
+    write_features(csv_path, rng.random((40, 8)))
+    rebuilt = compare_features.load_index("R3D18-Layer3-512")
+    assert rebuilt.size == 40
+    assert rebuilt.ids == compare_features.load_features_from_csv("R3D18-Layer3-512")[0]
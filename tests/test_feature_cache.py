@@ -0,0 +1,89 @@
+import os
+import json
+import shutil
+import numpy as np
+from feature_cache import CORPUS_FILES, TASK4_DIR, CorpusLookup, FeatureCache, content_hash
+from feature_store import load_features
+from manifest import resolve_path
+
+def committed_corpus(tmp_path):
+    """Copies of the committed task4 corpus CSVs, without any manifest next to them."""
+    corpus_dir = tmp_path / "task4"
+    corpus_dir.mkdir()
+    corpus_files = {}
+    for model, csv_path in CORPUS_FILES.items():
+        corpus_files[model] = str(corpus_dir / os.path.basename(csv_path))
+        shutil.copy(csv_path, corpus_files[model])
+    return corpus_files
+
+def query_file(tmp_path, stored_path, content=b"query"):
+    """A file on disk with the folder and file name of a stored corpus path."""
+    folder, name = stored_path.split("/")[-2:]
+    os.makedirs(tmp_path / "queries" / folder, exist_ok=True)
+    path = tmp_path / "queries" / folder / name
+    path.write_bytes(content)
+    return str(path)
+
+def stored_file(tmp_path, stored_path, content):
+    """Put the video a corpus row was built from on disk, where its path (relative to task4/) points."""
+    path = resolve_path(stored_path, tmp_path / "task4")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, mode="wb") as file:
+        file.write(content)
+    return path
+
+def test_corpus_rows_are_found_by_name_without_a_manifest(tmp_path):
+    corpus_files = committed_corpus(tmp_path)
+    lookup = CorpusLookup(corpus_files)
+
+    for model in ["R3D18-Layer3-512", "R3D18-Layer4-512", "R3D18-AvgPool-512", "COL-HIST-4x4-12"]:
+        _, paths, matrix = load_features(corpus_files[model])
+        stored = stored_file(tmp_path, paths[5], b"corpus video")
+        np.testing.assert_array_equal(lookup.get(content_hash(stored), model, stored), matrix[5])
+
+        # A copy elsewhere with the same folder and file name is the same video
+        copy = query_file(tmp_path, paths[5], b"corpus video")
+        np.testing.assert_array_equal(lookup.get(content_hash(copy), model, copy), matrix[5])
+
+    unknown = query_file(tmp_path, "ride_bike/not_in_the_corpus.avi")
+    assert lookup.get(content_hash(unknown), "R3D18-AvgPool-512", unknown) is None
+    assert lookup.get(content_hash(copy), "R3D18-AvgPool-512") is None
+
+def test_name_matches_need_the_stored_video_with_the_same_content(tmp_path):
+    corpus_files = committed_corpus(tmp_path)
+    _, paths, _ = load_features(corpus_files["R3D18-AvgPool-512"])
+    lookup = CorpusLookup(corpus_files)
+
+    # The stored video is not on disk
+    query = query_file(tmp_path, paths[3], b"another video")
+    assert lookup.get(content_hash(query), "R3D18-AvgPool-512", query) is None
+
+    stored_file(tmp_path, paths[3], b"corpus video")
+    assert lookup.get(content_hash(query), "R3D18-AvgPool-512", query) is None
+
+def test_feature_cache_serves_committed_corpus_rows(tmp_path):
+    corpus_files = committed_corpus(tmp_path)
+    cache = FeatureCache(cache_dir=str(tmp_path / "cache"), corpus=CorpusLookup(corpus_files))
+
+    _, paths, matrix = load_features(corpus_files["COL-HIST-4x4-12"])
+    path = stored_file(tmp_path, paths[0], b"corpus video")
+    np.testing.assert_array_equal(cache.lookup(path, "COL-HIST-4x4-12"), matrix[0])
+
+def test_bof_is_not_served_from_the_corpus(tmp_path):
+    # The corpus does not record its codebook, so a retrained one must not get its vectors
+    _, paths, _ = load_features(os.path.join(TASK4_DIR, "processed_histograms.csv"))
+    stip_path = query_file(tmp_path, paths[7])
+    assert CorpusLookup().get(content_hash(stip_path), "BOF-960-0123abcd", stip_path) is None
+
+def test_manifests_take_precedence_over_names(tmp_path):
+    corpus_files = committed_corpus(tmp_path)
+    _, paths, matrix = load_features(corpus_files["R3D18-AvgPool-512"])
+    path = query_file(tmp_path, paths[2])
+
+    video_path = resolve_path(paths[4], tmp_path / "task4")  # Manifests are keyed by absolute path
+    manifest = {"videos": {video_path: {"size": 0, "mtime": 0, "hash": content_hash(path)}}}
+    with open(tmp_path / "task4" / "features.manifest.json", mode="w") as file:
+        json.dump(manifest, file)
+
+    lookup = CorpusLookup(corpus_files)
+    np.testing.assert_array_equal(lookup.get(content_hash(path), "R3D18-AvgPool-512", path), matrix[4])
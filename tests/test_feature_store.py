@@ -0,0 +1,19 @@
+import numpy as np
+from feature_store import convert_csv, load_store
+
+def test_convert_csv_skips_blank_lines_and_keeps_quoted_newlines(tmp_path):
+    csv_path = tmp_path / "features.csv"
+    csv_path.write_text(
+        "filename,filepath,feature_0,feature_1\n"
+        "a.avi,videos/a.avi,1.0,2.0\n"
+        "\n"
+        "\"b\nc.avi\",\"videos/b\nc.avi\",3.0,4.0\n"
+        "d.avi,videos/d.avi,5.0,6.0\n"
+    )
+
+    convert_csv(str(csv_path))
+    ids, paths, matrix = load_store(str(csv_path))
+
+    assert ids == ["a.avi", "b\nc.avi", "d.avi"]
+    assert paths == ["videos/a.avi", "videos/b\nc.avi", "videos/d.avi"]
+    np.testing.assert_array_equal(matrix, [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]])
@@ -0,0 +1,35 @@
+import os
+import csv
+import numpy as np
+from get_closest_neighbours import compute_distances, load_corpus_sqrt, process_video_COL_HIST
+
+def write_corpus(csv_path, histograms):
+    with open(csv_path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["file_name", "file_path"] + [f"hist_bin_{i}" for i in range(histograms.shape[1])])
+        for i, histogram in enumerate(histograms):
+            writer.writerow([f"v{i}.avi", f"wave/v{i}.avi"] + list(histogram))
+
+def test_bhattacharyya_reuses_the_square_rooted_corpus_until_the_store_changes(tmp_path):
+    rng = np.random.default_rng(0)
+    csv_path = str(tmp_path / "histograms.csv")
+    corpus = rng.poisson(3.0, (20, 8)).astype(float)
+    write_corpus(csv_path, corpus)
+
+    corpus_sqrt = load_corpus_sqrt(csv_path)
+    np.testing.assert_allclose(corpus_sqrt, np.sqrt(corpus))
+    assert load_corpus_sqrt(csv_path) is corpus_sqrt
+
+    query = rng.poisson(3.0, 8).astype(float)
+    np.testing.assert_allclose(compute_distances(query, corpus, "bhattacharyya", corpus_sqrt),
+                               compute_distances(query, corpus, "bhattacharyya"))
+
+    results = process_video_COL_HIST(None, csv_path, "bhattacharyya", 3, histogram=query)
+    expected = np.argsort(compute_distances(query, corpus, "bhattacharyya")[0], kind="stable")[:3]
+    assert [name for name, _ in results] == [f"v{i}.avi" for i in expected]
+
+    # A rebuilt corpus is square-rooted again
+    write_corpus(csv_path, corpus[:10])
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert load_corpus_sqrt(csv_path).shape == (10, 8)
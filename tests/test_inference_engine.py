@@ -0,0 +1,18 @@
+import inference_engine
+
+def test_a_failed_forward_pass_fails_only_its_batch(monkeypatch):
+    def extract_features_batch(video_tensors):
+        raise RuntimeError("out of memory")
+
+    def load_video(video_file):
+        if video_file == "missing.avi":
+            raise FileNotFoundError(video_file)
+        return video_file
+
+    monkeypatch.setattr(inference_engine, "load_video", load_video)
+    monkeypatch.setattr(inference_engine, "extract_features_batch", extract_features_batch)
+
+    results = inference_engine.process_batch(["a.avi", "missing.avi", "b.avi"])
+
+    assert sorted(video_file for _, video_file, *_ in results) == ["a.avi", "b.avi", "missing.avi"]
+    assert all(layer3 is None for _, _, layer3, _, _ in results)
@@ -0,0 +1,20 @@
+import pytest
+import task5
+import feature_extraction
+from inference_modes import UNCALIBRATED_MODES
+
+def test_task5_accepts_the_uncalibrated_modes():
+    assert task5.INFERENCE_MODES == UNCALIBRATED_MODES
+
+def test_a_failed_extractor_is_not_rebuilt(monkeypatch):
+    monkeypatch.setenv(feature_extraction.INFERENCE_MODE_ENV, "int8_static")
+    monkeypatch.setattr(feature_extraction, "extractor", None)
+    monkeypatch.setattr(feature_extraction, "extractor_error", None)
+
+    with pytest.raises(ValueError, match="calibration clips"):
+        feature_extraction.get_extractor()
+    error = feature_extraction.extractor_error
+
+    with pytest.raises(ValueError) as second:
+        feature_extraction.get_extractor()
+    assert second.value is error
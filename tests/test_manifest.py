@@ -0,0 +1,58 @@
+import csv
+import json
+from manifest import prepare_incremental_build, resolve_path
+
+def write_csv(csv_path, paths):
+    with open(csv_path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["filename", "filepath", "feature_0"])
+        for path in paths:
+            writer.writerow([path.rsplit("/", 1)[-1], path, 1.0])
+
+def read_paths(csv_path):
+    with open(csv_path, mode="r", newline="") as file:
+        return [row[1] for row in list(csv.reader(file))[1:]]
+
+def test_first_run_adopts_rows_of_a_prepopulated_csv(tmp_path):
+    videos = []
+    for name in ["a.avi", "b.avi", "new.avi"]:
+        (tmp_path / name).write_bytes(name.encode())
+        videos.append(str(tmp_path / name))
+    a, b, new = videos
+    elsewhere = "../other_machine/c.avi"  # Built on another checkout, not on disk here
+
+    layer3 = str(tmp_path / "features_layer3.csv")
+    layer4 = str(tmp_path / "features_layer4.csv")
+    write_csv(layer3, [a, b, elsewhere])
+    write_csv(layer4, [a, b, elsewhere])
+    manifest_path = str(tmp_path / "features.manifest.json")
+
+    manifest, pending = prepare_incremental_build(manifest_path, videos, [layer3, layer4])
+
+    assert pending == [new]
+    assert read_paths(layer3) == [a, b, elsewhere]
+    assert read_paths(layer4) == [a, b, elsewhere]
+    with open(manifest_path) as file:
+        entries = json.load(file)["videos"]
+    assert entries[a]["hash"] is not None and entries[resolve_path(elsewhere, tmp_path)]["hash"] is None
+
+    # Later runs keep the adopted rows and still see changed videos
+    (tmp_path / "b.avi").write_bytes(b"changed")
+    _, pending = prepare_incremental_build(manifest_path, videos, [layer3, layer4])
+    assert sorted(pending) == sorted([b, new])
+    assert read_paths(layer3) == [a, elsewhere]
+
+def test_first_run_drops_rows_missing_from_some_outputs(tmp_path):
+    (tmp_path / "a.avi").write_bytes(b"a")
+    a = str(tmp_path / "a.avi")
+    partial = str(tmp_path / "partial.avi")
+
+    layer3 = str(tmp_path / "features_layer3.csv")
+    layer4 = str(tmp_path / "features_layer4.csv")
+    write_csv(layer3, [a, partial])
+    write_csv(layer4, [a])
+
+    _, pending = prepare_incremental_build(str(tmp_path / "features.manifest.json"), [a], [layer3, layer4])
+
+    assert pending == []
+    assert read_paths(layer3) == [a]
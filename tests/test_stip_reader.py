@@ -0,0 +1,29 @@
+import os
+import numpy as np
+from stip_reader import StipData, read_stip_file, stip_cache_path, SIGMA_COLUMN, TAU_COLUMN, CONFIDENCE_COLUMN, HOG_COLUMNS
+
+def test_top_pair_rows_keeps_file_order():
+    rng = np.random.default_rng(0)
+    stip_data = rng.random((10, 169)).astype(np.float32)
+    stip_data[:, SIGMA_COLUMN] = 4
+    stip_data[:, TAU_COLUMN] = 2
+    stip_data[:, CONFIDENCE_COLUMN] = np.arange(10)  # Most confident rows last
+
+    hog, hof = StipData.from_array(stip_data).top_pair_rows((4, 2), 3)
+
+    np.testing.assert_array_equal(hog, stip_data[:3, HOG_COLUMNS])
+    assert hof.shape == (3, 90)
+
+def test_a_truncated_cache_is_parsed_again_and_rewritten(tmp_path):
+    stip_path = tmp_path / "clip.avi.txt"
+    stip_path.write_text("# point-type x y t sigma2 tau2\n" + " ".join(["1.5"] * 169) + "\n")
+    expected = read_stip_file(str(stip_path), cache=True)
+
+    cache_path = stip_cache_path(str(stip_path))
+    with open(cache_path, mode="r+b") as file:
+        file.truncate(100)
+    assert os.path.getmtime(cache_path) >= os.path.getmtime(stip_path)
+
+    np.testing.assert_array_equal(read_stip_file(str(stip_path), cache=True), expected)
+    np.testing.assert_array_equal(np.load(cache_path), expected)
+    assert sorted(os.listdir(tmp_path)) == ["clip.avi.txt", "clip.avi.txt.npy"]
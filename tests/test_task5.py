@@ -0,0 +1,24 @@
+import task5
+from result_cache import result_cache
+
+def test_bof_query_needs_only_the_stip_file(tmp_path, monkeypatch):
+    video_path = str(tmp_path / "wave" / "clip.avi")  # Not on disk, only its STIP file is
+    stip_path = tmp_path / "wave" / "clip.avi.txt"
+    stip_path.parent.mkdir()
+    stip_path.write_text("1 2 3\n")
+
+    calls = []
+    def process_video(video_path, model, top_k, *args):
+        calls.append(model)
+        return [("neighbour.avi", 0.5)] * top_k
+    monkeypatch.setattr(task5, "process_video", process_video)
+    result_cache.clear()
+
+    for _ in range(2):
+        assert list(task5.process_video_models(video_path, ["BOF-960"], 3)) == [("BOF-960", [("neighbour.avi", 0.5)] * 3)]
+    assert calls == ["BOF-960"]
+
+    # The result is keyed by the STIP file's content
+    stip_path.write_text("4 5 6\n")
+    list(task5.process_video_models(video_path, ["BOF-960"], 3))
+    assert calls == ["BOF-960", "BOF-960"]
@@ -0,0 +1,40 @@
+import os
+import numpy as np
+import video_histograms
+from video_histograms import KeyFrameSampler, frame_positions
+
+def sample(total_frames, decoded, num_frames=3):
+    """Run a sampler over `decoded` frames whose frame value is their index."""
+    sampler = KeyFrameSampler(total_frames, num_frames)
+    held = 0
+    for index in range(decoded):
+        if sampler.wants(index):
+            sampler.add(index, index)
+        held = max(held, len(sampler.near) + len(sampler.sampled))
+    return sampler.frames(decoded), held
+
+def test_exact_when_frame_count_is_right_or_slightly_off():
+    for total_frames in [300, 298, 302]:
+        frames, _ = sample(total_frames, 300)
+        assert frames == frame_positions(300, 3)
+
+def test_last_frame_exact_when_video_is_longer_than_reported():
+    frames, _ = sample(100, 1000)
+    assert frames[0] == 0 and frames[-1] == 999
+
+def test_memory_is_bounded_without_frame_count():
+    frames, held = sample(0, 10000)
+    assert frames[0] == 0 and frames[-1] == 9999
+    assert abs(frames[1] - 5000) <= 10000 // 32
+    assert held <= 33
+
+def test_lab_bin_lut_is_moved_into_place_whole(tmp_path, monkeypatch):
+    lut_path = str(tmp_path / "lab_bin_lut.npy")
+    monkeypatch.setattr(video_histograms, "LAB_BIN_LUT_PATH", lut_path)
+    monkeypatch.setattr(video_histograms, "build_lab_bin_lut", lambda: np.arange(8, dtype=np.uint8).reshape(2, 2, 2))
+
+    lut = video_histograms.get_lab_bin_lut.__wrapped__()
+
+    np.testing.assert_array_equal(lut, np.arange(8))
+    assert os.listdir(tmp_path) == ["lab_bin_lut.npy"]
+    np.testing.assert_array_equal(video_histograms.get_lab_bin_lut.__wrapped__(), lut)